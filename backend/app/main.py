@@ -2,14 +2,21 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, documents, signatures, assistant, share, voice_chat, email, profile, billing
+from app.routers import auth, documents, signatures, assistant, share, voice_chat, email, profile, billing, metrics
+from app.services.compute_executor import shutdown_pools
+from app.services.supabase_service import close_client
+from app.services.crypto_service import get_server_kem_keypair
 from app.routers.auth import JWTMiddleware
 
 app = FastAPI(title="SignThatDoc API", 
               description="API for secure document signing with post-quantum cryptography",
               version="1.0.0")
 
-# Add CORS middleware
+# Add JWT middleware
+app.add_middleware(JWTMiddleware)
+
+# Added last so it is outermost: preflights are answered before auth runs,
+# and 401s from JWTMiddleware still carry CORS headers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Update with specific origins in production
@@ -18,9 +25,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add JWT middleware
-app.add_middleware(JWTMiddleware)
-
 # Include all routers
 app.include_router(auth.router, prefix="/auth")
 app.include_router(documents.router, prefix="/documents")
@@ -31,6 +35,20 @@ app.include_router(voice_chat.router, prefix="/voice_chat")
 app.include_router(email.router, prefix="/email")
 app.include_router(profile.router, prefix="/profile")
 app.include_router(billing.router, prefix="/billing")
+app.include_router(metrics.router, prefix="/metrics")
+
+@app.on_event("startup")
+def load_server_kem_keypair():
+    # Fail at startup rather than on the first share link
+    get_server_kem_keypair()
+
+@app.on_event("shutdown")
+def shutdown_compute_pools():
+    shutdown_pools()
+
+@app.on_event("shutdown")
+async def close_supabase_client():
+    await close_client()
 
 @app.get("/")
 def read_root():
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import datetime
+from uuid import UUID
 
 # Authentication models
 class UserSignup(BaseModel):
@@ -34,6 +35,7 @@ class DocumentResponse(BaseModel):
     created_at: datetime
     updated_at: Optional[datetime] = None
     is_signed: bool = False
+    fingerprint: Optional[Dict[str, Any]] = None
 
 class DocumentList(BaseModel):
     documents: List[DocumentResponse]
@@ -49,6 +51,27 @@ class SignatureRequest(BaseModel):
     position_x: float
     position_y: float
     page_number: int = 1
+    signature_id: Optional[str] = None  # Defaults to the user's most recent signature
+
+class SignaturePlacement(BaseModel):
+    page_number: int = Field(1, ge=1)
+    position_x: float
+    position_y: float
+    width: float = Field(200, gt=0)
+    height: float = Field(100, gt=0)
+
+class MultiSignatureRequest(BaseModel):
+    document_id: str
+    placements: List[SignaturePlacement] = Field(..., min_length=1, max_length=1000)
+    signature_id: Optional[str] = None
+
+class BulkSignatureRequest(BaseModel):
+    document_ids: List[str] = Field(..., min_length=1, max_length=500)
+    placements: List[SignaturePlacement] = Field(..., min_length=1, max_length=1000)
+    signature_id: Optional[str] = None
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1, max_length=500)
 
 class SignatureResponse(BaseModel):
     signature_id: str
@@ -1,45 +1,68 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
 from app.models import DocumentQuery, AIResponse, APIResponse
 from app.services.ai_service import analyze_document, query_document
-from app.services.supabase_service import download_file
-from app.routers.auth import get_current_user
+from app.services.supabase_service import download_file, get_document_record, resolve_document_path
+from app.routers.auth import get_current_user, admission_control
 from typing import Optional
 import os
 
 router = APIRouter(tags=["AI Assistant"])
 
-@router.post("/analyze-doc/{document_id}", response_model=APIResponse)
+@router.post("/analyze-doc/{document_id}", response_model=APIResponse, dependencies=[Depends(admission_control("ml"))])
 async def analyze_document_endpoint(
     document_id: str,
     user_id: str = Depends(get_current_user)
 ):
     """
     Analyze a document:
-    1. Extract text from uploaded PDF using PyMuPDF
+    1. Extract text from the uploaded PDF (PyMuPDF), DOCX or TXT
     2. Chunk text into 500-700 tokens per chunk
     3. Generate embeddings using bge-base-en-v1.5 model
     4. Save embeddings into vector database
     """
     try:
+        # Look up the document's storage path from its metadata row
+        document = await get_document_record(document_id, user_id)
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found or access denied"
+            )
+        
+        # Skip the download and extraction when the upload fingerprint shows there is no text to index
+        fingerprint = document.get("fingerprint") or {}
+        if fingerprint.get("is_encrypted"):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Document is encrypted and cannot be analyzed"
+            )
+        if fingerprint.get("has_text_layer") is False:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Document has no text layer (scanned or image-only PDF); nothing to analyze"
+            )
+        
         # Fetch document from Storage
-        document_path = f"documents/{document_id}"  # This is simplified, would typically look up the actual path
-        document_content = await download_file("documents", document_path)
+        document_content = await download_file("documents", resolve_document_path(document))
         
         # Analyze document (extract text, chunk, embed, store)
-        analysis_result = await analyze_document(document_content, document_id)
+        analysis_result = await analyze_document(document_content, document_id, document.get("file_type", "pdf"),
+                                                 fingerprint.get("page_count"))
         
         return APIResponse(
             status="success",
             data=analysis_result,
             message="Document analyzed and indexed successfully"
         )
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to analyze document: {str(e)}"
         )
 
-@router.post("/ask", response_model=APIResponse)
+@router.post("/ask", response_model=APIResponse, dependencies=[Depends(admission_control("ml"))])
 async def ask_question(
     query: DocumentQuery,
     user_id: str = Depends(get_current_user)
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.types import ASGIApp, Receive, Scope, Send
 from app.models import UserSignup, UserLogin, UserResponse, APIResponse
-from app.services.supabase_service import register_user, login_user, store_user_public_key
+from app.services.supabase_service import register_user, login_user, store_user_public_key, get_user_profile
+from app.services.admission import AdmissionRejected, admit, refund, release
 from app.services.crypto_service import generate_dilithium_keypair
-from typing import Annotated
+from app.services.cache import LRUCache, MISSING
+from typing import Annotated, Any, Callable, Optional
+import hashlib
 import json
 from jose import jwt, JWTError
 import os
@@ -14,30 +19,104 @@ load_dotenv()
 # Constants
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
+VERIFIED_TOKEN_CACHE_MAX_ITEMS = int(os.getenv("VERIFIED_TOKEN_CACHE_MAX_ITEMS", 10000))
+
+# Routes reachable without a token
+PUBLIC_PATHS = frozenset({"/", "/auth/signup", "/auth/login", "/docs", "/docs/oauth2-redirect", "/redoc",
+                          "/openapi.json", "/share/guest-sign", "/billing/stripe-webhook"})
 
 router = APIRouter(tags=["Authentication"])
 security = HTTPBearer()
 
+# SHA-256 of a token -> its verified claims, kept until the token's exp
+_verified_tokens = LRUCache(max_items=VERIFIED_TOKEN_CACHE_MAX_ITEMS)
+
+def verify_token(token: str) -> dict:
+    """Return the claims of a valid token, checking the signature only the first time it is seen.
+
+    Raises JWTError for invalid or expired tokens and tokens without a subject.
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = _verified_tokens.get(key)
+    if claims is not MISSING:
+        return claims
+
+    claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    if claims.get("sub") is None:
+        raise JWTError("Token has no subject")
+    # Tokens without an expiry are verified every time rather than trusted indefinitely
+    if isinstance(claims.get("exp"), (int, float)):
+        _verified_tokens.set(key, claims, expires_at=claims["exp"])
+    return claims
+
+def verified_token_cache_stats():
+    """Hit/miss counters of the verified token cache."""
+    return _verified_tokens.stats()
+
 # JWT Dependency
-async def get_current_user(credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)]):
-    """Validates JWT and attaches user_id to request."""
+async def get_current_user(request: Request, credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)]):
+    """Returns the user_id of the request, reusing the claims JWTMiddleware already verified."""
+    claims = getattr(request.state, "claims", None)
+    if claims is not None:
+        return claims["sub"]
     try:
-        payload = jwt.decode(
-            credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM]
-        )
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-        return user_id
+        return verify_token(credentials.credentials)["sub"]
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication token",
         )
 
+def admission_control(resource: str, cost: Optional[Callable[[Any], int]] = None):
+    """Dependency that admits a request to an expensive resource class ("ml" or "signing").
+
+    Over the rate limit of the caller's plan it fails fast with 429, and with
+    503 when the resource's queue is full; both carry Retry-After. Guests on
+    public routes are limited per client address at free tier rates. cost,
+    if given, maps the JSON body (already parsed by FastAPI) to the number of
+    tokens the request spends; otherwise a request costs one. Requests that
+    end in a 4xx, including body validation errors, get their tokens back.
+    """
+    async def dependency(request: Request):
+        tokens = 1
+        if cost is not None:
+            try:
+                tokens = cost(await request.json())
+            except Exception:
+                pass  # a malformed body fails validation right after this
+        user_id = getattr(request.state, "user_id", None)
+        plan_name = None
+        if user_id is not None:
+            user_key = user_id
+            try:
+                plan_name = (await get_user_profile(user_id)).get("current_plan")
+            except Exception as e:
+                print(f"Error loading plan for admission: {str(e)}")
+        else:
+            user_key = f"guest:{request.client.host if request.client else 'unknown'}"
+
+        try:
+            await admit(resource, user_key, plan_name, tokens)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=e.status_code,
+                detail=e.detail,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        try:
+            yield
+        # A request rejected for its own input did no expensive work, so it does not use up quota
+        except RequestValidationError:
+            refund(resource, user_key, plan_name, tokens)
+            raise
+        except HTTPException as e:
+            if 400 <= e.status_code < 500:
+                refund(resource, user_key, plan_name, tokens)
+            raise
+        finally:
+            release(resource)
+    return dependency
+
 @router.post("/signup", response_model=APIResponse)
 async def signup(user: UserSignup):
     """
@@ -104,28 +183,59 @@ async def login(user: UserLogin):
             detail=f"Login failed: {str(e)}"
         )
 
-# Middleware class to attach to main.py if needed
+def _unauthorized_response(detail: str):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    start = {
+        "type": "http.response.start",
+        "status": status.HTTP_401_UNAUTHORIZED,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"www-authenticate", b"Bearer"),
+        ],
+    }
+    return start, {"type": "http.response.body", "body": body}
+
+_MISSING_HEADER_RESPONSE = _unauthorized_response("Missing or invalid authorization header")
+_INVALID_TOKEN_RESPONSE = _unauthorized_response("Invalid authentication token")
+
 class JWTMiddleware:
-    async def __call__(self, request: Request, call_next):
-        if request.url.path in ["/auth/signup", "/auth/login", "/"]:
-            return await call_next(request)
-            
+    """Verifies the bearer token once per request and leaves the claims on request.state.
+
+    Written as plain ASGI so responses, streaming ones included, pass through
+    untouched, and rejections are sent without building a Request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # CORS preflights carry no credentials
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in PUBLIC_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value
+                break
+        if authorization is None or not authorization.startswith(b"Bearer "):
+            await self._reject(send, _MISSING_HEADER_RESPONSE)
+            return
+
         try:
-            token = request.headers.get("Authorization")
-            if not token or not token.startswith("Bearer "):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Missing or invalid authorization header"
-                )
-                
-            token = token.split(" ")[1]
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            request.state.user_id = payload.get("sub")
-            
+            claims = verify_token(authorization[7:].decode("latin-1"))
         except JWTError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication token"
-            )
-            
-        return await call_next(request)
+            await self._reject(send, _INVALID_TOKEN_RESPONSE)
+            return
+
+        state = scope.setdefault("state", {})
+        state["claims"] = claims
+        state["user_id"] = claims["sub"]
+        await self.app(scope, receive, send)
+
+    async def _reject(self, send: Send, response):
+        start, body = response
+        await send(start)
+        await send(body)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, BackgroundTasks
 from app.models import APIResponse
 from app.routers.auth import get_current_user
+from app.services.supabase_service import invalidate_user_profile
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import stripe
@@ -33,14 +34,6 @@ PLAN_PRICES = {
     "payg": os.getenv("STRIPE_PAYG_PRICE_ID"),
 }
 
-# Plan details mapping
-PLAN_DETAILS = {
-    "creator": {"name": "Creator Plan", "document_limit": 10},
-    "pro": {"name": "Pro Plan", "document_limit": 100},
-    "premium": {"name": "Premium Plan", "document_limit": 250},
-    "payg": {"name": "Pay As You Go", "document_limit": 1},
-}
-
 @router.post("/create-checkout-session", response_model=APIResponse)
 async def create_checkout_session(
     request: CheckoutSessionRequest,
@@ -145,6 +138,9 @@ async def handle_subscription_created(event_data: Dict[str, Any]):
     # Update user's subscription in database
     # In a real implementation, call supabase_service to update the subscription
     print(f"User {user_id} subscribed to {plan_id} plan with subscription ID {subscription_id}")
+    
+    # The cached profile carries the plan and its document limit
+    invalidate_user_profile(user_id)
 
 async def handle_payment_succeeded(event_data: Dict[str, Any]):
     """Background task to handle payment_intent.succeeded event"""
@@ -161,6 +157,7 @@ async def handle_payment_succeeded(event_data: Dict[str, Any]):
         # Add one document credit to the user
         # In a real implementation, call supabase_service to update document credits
         print(f"Added 1 document credit for user {user_id}")
+        invalidate_user_profile(user_id)
 
 @router.post("/stripe-webhook")
 async def stripe_webhook(request: Request, background_tasks: BackgroundTasks):
@@ -212,6 +209,9 @@ async def stripe_webhook(request: Request, background_tasks: BackgroundTasks):
         elif event_type == "subscription.deleted":
             # Subscription was cancelled - update user's plan
             print(f"Subscription {event_data['object']['id']} was cancelled")
+            user_id = event_data["object"].get("metadata", {}).get("user_id")
+            if user_id:
+                invalidate_user_profile(user_id)
         
         # Return a success response
         return {"status": "success"}
@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Path
-from fastapi.responses import JSONResponse
-from app.models import DocumentResponse, DocumentList, APIResponse
-from app.services.supabase_service import upload_file, get_file_url, save_document_metadata, fetch_user_documents, delete_document
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Path, Query, BackgroundTasks
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from app.models import DocumentResponse, DocumentList, BulkDeleteRequest, APIResponse
+from app.services.supabase_service import get_file_url, save_document_metadata, fetch_user_documents, delete_document, delete_documents, store_document_content, release_document_content, get_document_record, DOCUMENT_LIST_COLUMNS
+from app.services.pagination import decode_cursor, parse_columns, split_page, stream_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.crypto_service import hash_document
+from app.services.compute_executor import run_in_pool
+from app.services.pdf_service import optimize_pdf, fingerprint_pdf
+from app.services.preview_service import get_page_preview, prerender_previews, PREVIEW_FORMATS, DEFAULT_PREVIEW_DPI
 from app.routers.auth import get_current_user
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 import os
-import uuid
 from datetime import datetime
 
 router = APIRouter(tags=["Documents"])
 
 ALLOWED_EXTENSIONS = {"pdf", "docx", "txt"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+OPTIMIZE_PDF_UPLOADS = os.getenv("OPTIMIZE_PDF_UPLOADS", "false").lower() == "true"
+OPTIMIZE_MAX_IMAGE_DPI = int(os.getenv("OPTIMIZE_MAX_IMAGE_DPI", 0)) or None  # 0 keeps image resolution
 
 def validate_file_type(filename: str):
     """Validate if the uploaded file has an allowed extension."""
@@ -25,6 +31,7 @@ def validate_file_type(filename: str):
 
 @router.post("/upload", response_model=APIResponse)
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     user_id: str = Depends(get_current_user)
 ):
@@ -50,23 +57,67 @@ async def upload_document(
         # Validate file type
         file_extension = validate_file_type(file.filename)
         
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = f"documents/{user_id}/{unique_filename}"
+        # Digest of the bytes as uploaded, kept for audit even if we store an optimized copy
+        original_digest = (await hash_document(bytes(file_content))).hex()
+        original_size = file_size
+        content_digest = original_digest
+        optimization = None
         
-        # Upload file to Supabase Storage
-        await upload_file("documents", file_path, file_content, file.content_type)
+        # Optionally garbage-collect, deflate and dedupe the PDF before anything else reads it
+        if file_extension == "pdf" and OPTIMIZE_PDF_UPLOADS:
+            try:
+                optimized_content, optimization = await run_in_pool("pdf", optimize_pdf, bytes(file_content), OPTIMIZE_MAX_IMAGE_DPI)
+            except Exception as e:
+                # Optimization is best effort; store the upload as-is
+                print(f"Error optimizing PDF upload: {str(e)}")
+                optimization = {"optimized": False, "reason": "error"}
+            if optimization["optimized"]:
+                file_content = optimized_content
+                content_digest = (await hash_document(file_content)).hex()
+            optimization["original_size"] = original_size
+            optimization["optimized_size"] = len(file_content)
+            optimization["bytes_saved"] = original_size - len(file_content)
+        
+        # Record page count, page sizes, text layer and encryption once, so later
+        # requests can validate and skip work without reopening the file
+        fingerprint = None
+        if file_extension == "pdf":
+            try:
+                fingerprint = await run_in_pool("pdf", fingerprint_pdf, bytes(file_content))
+                fingerprint["content_digest"] = content_digest
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Could not read PDF: {str(e)}"
+                )
+        
+        # Upload file to Supabase Storage (skipped if the content is already stored)
+        stored = await store_document_content(content_digest, file_content, file.content_type)
         
         # Get public URL
-        file_url = await get_file_url("documents", file_path)
-        
-        # Save metadata to database
-        document_metadata = await save_document_metadata(
-            user_id=user_id,
-            file_url=file_url,
-            file_name=file.filename,
-            file_type=file_extension
-        )
+        file_url = await get_file_url("documents", stored["storage_path"])
+        
+        # Save metadata to database, dropping our reference if the row cannot be written
+        try:
+            document_metadata = await save_document_metadata(
+                user_id=user_id,
+                file_url=file_url,
+                file_name=file.filename,
+                file_type=file_extension,
+                content_digest=content_digest,
+                storage_path=stored["storage_path"],
+                file_size=stored["file_size"],
+                original_digest=original_digest if content_digest != original_digest else None,
+                original_size=original_size,
+                fingerprint=fingerprint
+            )
+        except Exception:
+            await release_document_content(content_digest)
+            raise
+        
+        # Warm the page preview cache for the signing UI once the response is sent
+        if file_extension == "pdf":
+            background_tasks.add_task(prerender_previews, document_metadata.data[0], bytes(file_content))
         
         return APIResponse(
             status="success",
@@ -75,6 +126,10 @@ async def upload_document(
                 "file_name": file.filename,
                 "file_type": file_extension,
                 "file_url": file_url,
+                "content_digest": content_digest,
+                "original_digest": original_digest,
+                "optimization": optimization,
+                "fingerprint": fingerprint,
                 "created_at": datetime.utcnow().isoformat()
             },
             message="Document uploaded successfully"
@@ -87,25 +142,138 @@ async def upload_document(
             detail=f"Failed to upload document: {str(e)}"
         )
         
-@router.get("/list", response_model=APIResponse)
-async def list_documents(user_id: str = Depends(get_current_user)):
+@router.get("/list")
+async def list_documents(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    columns: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(DOCUMENT_LIST_COLUMNS)}"),
+    file_type: Optional[str] = Query(None, description="pdf, docx or txt"),
+    is_signed: Optional[bool] = Query(None),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    List the authenticated user's documents, newest first, one page at a time.
+    Pages are keyed on (created_at, id), so every page costs the same however many documents exist.
+    """
+    try:
+        try:
+            page_after = decode_cursor(cursor) if cursor else None
+            projection = parse_columns(columns, DOCUMENT_LIST_COLUMNS)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        # Fetch one page (plus one row to know whether there is another) from the database
+        rows = await fetch_user_documents(
+            user_id,
+            limit=limit,
+            cursor=page_after,
+            columns=projection,
+            file_type=file_type.lower() if file_type else None,
+            is_signed=is_signed,
+            created_after=created_after.isoformat() if created_after else None,
+            created_before=created_before.isoformat() if created_before else None
+        )
+        documents, next_cursor = split_page(rows, limit)
+        
+        return StreamingResponse(
+            stream_page("documents", documents, next_cursor, "Documents retrieved successfully"),
+            media_type="application/json"
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve documents: {str(e)}"
+        )
+
+@router.get("/{document_id}/pages/{page_number}/preview")
+async def preview_page(
+    document_id: str = Path(..., description="The ID of the document"),
+    page_number: int = Path(..., ge=1, description="1-based page number"),
+    dpi: int = Query(DEFAULT_PREVIEW_DPI, ge=36, le=300),
+    format: str = Query("png", description="png or webp"),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Render a page of a stored PDF for the signing UI.
+    Tiles are cached in memory and on disk by content digest, page and DPI.
+    """
+    try:
+        image_format = format.lower()
+        if image_format not in PREVIEW_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Format not supported. Supported formats: {', '.join(PREVIEW_FORMATS)}"
+            )
+        
+        document = await get_document_record(document_id, user_id)
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found or access denied"
+            )
+        if document.get("file_type") != "pdf":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Previews are only available for PDF documents"
+            )
+        
+        tile = await get_page_preview(document, page_number, dpi, image_format)
+        if tile is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Page {page_number} does not exist"
+            )
+        
+        # Tiles are immutable for a given document digest, so browsers may keep them
+        return Response(
+            content=tile,
+            media_type=PREVIEW_FORMATS[image_format],
+            headers={"Cache-Control": "private, max-age=86400"}
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to render page preview: {str(e)}"
+        )
+
+@router.post("/bulk-delete", response_model=APIResponse)
+async def bulk_delete_documents(
+    request: BulkDeleteRequest,
+    user_id: str = Depends(get_current_user)
+):
     """
-    List all documents uploaded by the authenticated user.
+    Delete many documents at once:
+    1. Verify ownership of every id in one query
+    2. Remove their storage objects in one batched call
+    3. Delete the rows with a single filter and report each id's outcome
     """
     try:
-        # Fetch documents from database
-        response = await fetch_user_documents(user_id)
-        documents = response.data
+        document_ids = list(dict.fromkeys(str(document_id) for document_id in request.ids))
+        outcomes = await delete_documents(document_ids, user_id)
+        deleted = sum(1 for outcome in outcomes.values() if outcome == "deleted")
         
         return APIResponse(
             status="success",
-            data={"documents": documents},
-            message="Documents retrieved successfully"
+            data={
+                "results": [{"document_id": document_id, "status": outcome} for document_id, outcome in outcomes.items()],
+                "deleted": deleted,
+                "not_found": len(outcomes) - deleted
+            },
+            message=f"Deleted {deleted} of {len(outcomes)} documents"
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to retrieve documents: {str(e)}"
+            detail=f"Failed to delete documents: {str(e)}"
         )
 
 @router.delete("/{document_id}", response_model=APIResponse)
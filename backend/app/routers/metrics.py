@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.models import APIResponse
+from app.services.compute_executor import get_pool_stats
+from app.services.metrics import histograms_snapshot
+from app.services.document_cache import document_cache_stats
+from app.services.admission import admission_stats
+from app.services.supabase_service import SUPABASE_MAX_CONCURRENCY, SUPABASE_TIMEOUT_SECONDS, SUPABASE_STORAGE_TIMEOUT_SECONDS, public_key_cache_stats
+from app.routers.auth import get_current_user, verified_token_cache_stats
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/compute", response_model=APIResponse)
+async def compute_metrics(user_id: str = Depends(get_current_user)):
+    """
+    Report compute pool sizing, queue depth and wait/run-time histograms.
+    """
+    try:
+        return APIResponse(
+            status="success",
+            data={"pools": get_pool_stats()},
+            message="Compute metrics retrieved successfully"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve compute metrics: {str(e)}"
+        )
+
+@router.get("/supabase", response_model=APIResponse)
+async def supabase_metrics(user_id: str = Depends(get_current_user)):
+    """
+    Report per-call Supabase latency histograms, the client limits and
+    document and public key cache hit rates.
+    """
+    try:
+        return APIResponse(
+            status="success",
+            data={
+                "max_concurrency": SUPABASE_MAX_CONCURRENCY,
+                "timeout_seconds": SUPABASE_TIMEOUT_SECONDS,
+                "storage_timeout_seconds": SUPABASE_STORAGE_TIMEOUT_SECONDS,
+                "calls": histograms_snapshot("supabase."),
+                "document_cache": document_cache_stats(),
+                "public_key_cache": public_key_cache_stats()
+            },
+            message="Supabase metrics retrieved successfully"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve Supabase metrics: {str(e)}"
+        )
+
+@router.get("/auth", response_model=APIResponse)
+async def auth_metrics(user_id: str = Depends(get_current_user)):
+    """
+    Report verified token cache hit rates.
+    """
+    try:
+        return APIResponse(
+            status="success",
+            data={"verified_token_cache": verified_token_cache_stats()},
+            message="Auth metrics retrieved successfully"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve auth metrics: {str(e)}"
+        )
+
+@router.get("/admission", response_model=APIResponse)
+async def admission_metrics(user_id: str = Depends(get_current_user)):
+    """
+    Report admission control queue depth, wait times and rejection counts per resource class.
+    """
+    try:
+        return APIResponse(
+            status="success",
+            data=admission_stats(),
+            message="Admission metrics retrieved successfully"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve admission metrics: {str(e)}"
+        )
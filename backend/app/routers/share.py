@@ -1,16 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
 from fastapi.responses import JSONResponse
 from app.models import GuestLink, GuestSignature, APIResponse
-from app.services.crypto_service import generate_dilithium_keypair, encrypt_session_data, sign_document_hash, hash_document
-from app.services.supabase_service import download_file, upload_file, get_file_url
-from app.routers.auth import get_current_user
+from app.services.crypto_service import generate_dilithium_keypair, encrypt_session_data, decrypt_session_data, sign_document_hash
+from app.services.supabase_service import get_document_record
+from app.services.signature_service import render_uploaded_signature
+from app.services.signing_service import validate_placements, signing_work_dir, fetch_document_to_path, stamp_document_file, upload_signed_file, is_large_document
+from app.routers.auth import get_current_user, admission_control
+from app.routers.signatures import validate_signature_file
 from datetime import datetime, timedelta
 import uuid
 import json
-import fitz  # PyMuPDF
-import io
-from PIL import Image
-import base64
 import os
 
 router = APIRouter(tags=["Document Sharing"])
@@ -32,22 +31,16 @@ async def generate_share_link(
         session_id = str(uuid.uuid4())
         expires_at = datetime.utcnow() + timedelta(hours=expiry_hours)
         
-        # Data to encrypt
+        # Data to encrypt (compact separators keep the token short)
         session_data = json.dumps({
             "session_id": session_id,
             "document_id": document_id,
             "created_by": user_id,
             "expires_at": expires_at.isoformat()
-        })
+        }, separators=(",", ":"))
         
-        # Encrypt with Kyber (no recipient public key, so we'll generate one)
-        encrypted_data, encapsulated_key = await encrypt_session_data(session_data)
-        
-        # Store the session details in database (would typically be in a sessions table)
-        # For this example, we'll just return the encrypted link
-        
-        # Create a sharing link format (in production would be a proper URL)
-        sharing_link = f"{encrypted_data}:{encapsulated_key}"
+        # Encrypt to the server's Kyber key; the token is URL-safe and authenticated
+        sharing_link = await encrypt_session_data(session_data)
         
         return APIResponse(
             status="success",
@@ -64,7 +57,7 @@ async def generate_share_link(
             detail=f"Failed to generate sharing link: {str(e)}"
         )
 
-@router.post("/guest-sign", response_model=APIResponse)
+@router.post("/guest-sign", response_model=APIResponse, dependencies=[Depends(admission_control("signing"))])
 async def guest_sign_document(
     session_link: str = Form(...),
     signature_file: UploadFile = File(...),
@@ -84,22 +77,14 @@ async def guest_sign_document(
     6. Store guest signer information
     """
     try:
-        # Parse the session link
-        # In a real implementation, this would involve decrypting with the server's Kyber private key
-        # For this example, we'll simulate by parsing the link format
-        encrypted_data, encapsulated_key = session_link.split(":")
-        
-        # In production, decrypt session data
-        # session_data = await decrypt_session_data(encrypted_data, encapsulated_key, server_private_key)
-        # session = json.loads(session_data)
-        
-        # For this example, we'll simulate with dummy data
-        session = {
-            "session_id": str(uuid.uuid4()),
-            "document_id": "example_doc_id",
-            "created_by": "original_user_id",
-            "expires_at": (datetime.utcnow() + timedelta(hours=1)).isoformat()
-        }
+        # Decrypt the session link with the server's Kyber private key
+        try:
+            session = json.loads(await decrypt_session_data(session_link))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Invalid signing session link"
+            )
         
         # Check if session is expired
         expires_at = datetime.fromisoformat(session["expires_at"])
@@ -110,68 +95,67 @@ async def guest_sign_document(
             )
         
         # Read signature file
+        signature_extension = validate_signature_file(signature_file.filename)
         signature_content = await signature_file.read()
         
-        # Fetch document from storage
-        document_path = f"documents/{session['document_id']}"
-        document_content = await download_file("documents", document_path)
-        
-        # Create a PDF object
-        pdf_document = fitz.open(stream=document_content, filetype="pdf")
-        
-        # Get the specified page
-        page = pdf_document[page_number - 1]  # 0-indexed
-        
-        # Create an image object from signature content
-        signature_image = Image.open(io.BytesIO(signature_content))
-        
-        # Convert image to PNG if it's not already
-        if signature_image.format != "PNG":
-            img_bytes = io.BytesIO()
-            signature_image.save(img_bytes, format="PNG")
-            img_bytes.seek(0)
-            signature_content = img_bytes.read()
-        
-        # Insert signature image at the specified coordinates
-        rect = fitz.Rect(position_x, position_y, 
-                         position_x + 200, position_y + 100)  # Adjust size as needed
-        page.insert_image(rect, stream=signature_content)
-        
-        # Save modified PDF to memory
-        output_stream = io.BytesIO()
-        pdf_document.save(output_stream)
-        pdf_document.close()
-        
-        # Get the modified document content
-        modified_document = output_stream.getvalue()
-        
-        # Hash the document
-        document_hash = await hash_document(modified_document)
-        
-        # Generate temporary Dilithium2 keys for the guest
-        guest_private_key, guest_public_key = await generate_dilithium_keypair()
-        
-        # Sign with guest's temporary key
-        signature = await sign_document_hash(document_hash, guest_private_key)
-        
-        # Create signature metadata
-        signature_metadata = {
-            "signer": guest_name,
-            "signer_email": guest_email,
-            "timestamp": datetime.utcnow().isoformat(),
-            "public_key": guest_public_key,
-            "signature": signature,
-            "hash_algorithm": "SHA3-256",
-            "session_id": session["session_id"],
-            "is_guest": True
-        }
+        # Look up the shared document on behalf of the user who created the link
+        document = await get_document_record(session["document_id"], session["created_by"])
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Shared document no longer exists"
+            )
         
-        # Upload the signed document
-        signed_document_path = f"guest_signed/{session['document_id']}/{uuid.uuid4()}.pdf"
-        await upload_file("documents", signed_document_path, modified_document, "application/pdf")
+        # Reject a page the document does not have before downloading it
+        try:
+            validate_placements(document, [{"page_number": page_number}])
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
         
-        # Get signed document URL
-        signed_document_url = await get_file_url("documents", signed_document_path)
+        # Normalize and pre-scale the signature (reused if the same file is uploaded again)
+        signature_content = await render_uploaded_signature(signature_content, signature_extension)
+        
+        # Work on a file, as signed-in signing does, so large documents never sit in memory
+        with signing_work_dir() as work_dir:
+            document_path = os.path.join(work_dir, "document.pdf")
+            await fetch_document_to_path(document, document_path)
+            
+            # Stamp the signature and compute the per-page Merkle root it will cover
+            merkle_info = await stamp_document_file(
+                document_path, signature_content,
+                [{"page_number": page_number, "position_x": position_x, "position_y": position_y}]
+            )
+            
+            # The signature covers the Merkle root of every page and the trailer
+            document_hash = bytes.fromhex(merkle_info["merkle_root"])
+            
+            # Generate temporary Dilithium2 keys for the guest
+            guest_private_key, guest_public_key = await generate_dilithium_keypair()
+            
+            # Sign with guest's temporary key
+            signature = await sign_document_hash(document_hash, guest_private_key)
+            
+            # Create signature metadata
+            signature_metadata = {
+                "signer": guest_name,
+                "signer_email": guest_email,
+                "timestamp": datetime.utcnow().isoformat(),
+                "public_key": guest_public_key,
+                "signature": signature,
+                "hash_algorithm": "SHA3-256-Merkle",
+                "merkle_root": merkle_info["merkle_root"],
+                "page_count": merkle_info["page_count"],
+                "session_id": session["session_id"],
+                "is_guest": True
+            }
+            
+            # Upload the signed document
+            signed_document_url = await upload_signed_file(
+                f"guest_signed/{session['document_id']}", document_path, is_large_document(document)
+            )
         
         return APIResponse(
             status="success",
@@ -182,6 +166,8 @@ async def guest_sign_document(
             },
             message="Document signed by guest successfully"
         )
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,21 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Path
-from app.models import SignatureRequest, SignatureResponse, APIResponse
-from app.services.supabase_service import upload_file, get_file_url, store_user_public_key, get_user_public_key, download_file, fetch_user_signatures, delete_signature
-from app.services.crypto_service import hash_document, sign_document_hash
-from app.routers.auth import get_current_user
-import fitz  # PyMuPDF
-import io
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Path, Query
+from fastapi.responses import StreamingResponse
+from app.models import SignatureRequest, MultiSignatureRequest, BulkSignatureRequest, BulkDeleteRequest, SignatureResponse, APIResponse
+from app.services.supabase_service import upload_file, get_file_url, store_user_public_key, get_user_public_key, fetch_user_signatures, delete_signature, delete_signatures, get_document_record, get_document_records, save_signature_metadata, get_signature_record, SIGNATURE_LIST_COLUMNS
+from app.services.pagination import decode_cursor, parse_columns, split_page, stream_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.signature_service import create_signature_rendition, get_signature_rendition, evict_signature_rendition
+from app.services.crypto_service import sign_document_hash
+from app.services.signing_service import sign_stored_document, bulk_sign_documents, signing_work_dir
+from app.services.pdf_service import verify_page_file
+from app.services.compute_executor import run_in_pool
+from app.services.admission import signing_cost
+from app.routers.auth import get_current_user, admission_control
 import os
 import uuid
-from PIL import Image
 from datetime import datetime
-import base64
 import json
+import time
+from typing import Optional
 
 router = APIRouter(tags=["Signatures"])
 
 ALLOWED_SIGNATURE_EXTENSIONS = {"svg", "png", "jpg", "jpeg"}
 MAX_SIGNATURE_SIZE = 5 * 1024 * 1024  # 5 MB
+MAX_VERIFY_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 
 def validate_signature_file(filename: str):
     """Validate if the uploaded signature file has an allowed extension."""
@@ -57,16 +63,21 @@ async def save_signature_style(
         # Upload signature to Supabase Storage
         await upload_file("signatures", file_path, file_content, file.content_type)
         
+        # Convert, trim and pre-scale once, so signing calls reuse the PNG as-is
+        rendition_path = await create_signature_rendition(file_path, file_content, file_extension)
+        
         # Get public URL
         signature_url = await get_file_url("signatures", file_path)
         
-        # Update user profile with signature URL
-        # In a real app, update a signatures table or user profile
-        # For now, we'll just return the URL
+        # Link the signature to the user
+        signature_record = await save_signature_metadata(user_id, signature_url, rendition_path)
         
         return APIResponse(
             status="success",
-            data={"signature_url": signature_url},
+            data={
+                "signature_id": signature_record.data[0]["id"],
+                "signature_url": signature_url
+            },
             message="Signature style saved successfully"
         )
     except HTTPException as he:
@@ -77,7 +88,42 @@ async def save_signature_style(
             detail=f"Failed to save signature style: {str(e)}"
         )
 
-@router.post("/apply-signature", response_model=APIResponse)
+async def sign_document_for_user(user_id: str, document_id: str, signature_id, placements):
+    """
+    Stamp a user's signature at the given placements, sign the Merkle root once
+    and upload the signed document. Shared by the single and multi-placement endpoints.
+    """
+    # Fetch user's signature style (the requested one, or their most recent)
+    signature = await get_signature_record(user_id, signature_id)
+    if not signature:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No saved signature found"
+        )
+    
+    # Look up the document's storage path from its metadata row
+    document = await get_document_record(document_id, user_id)
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found or access denied"
+        )
+    
+    # Fetch the pre-rendered signature PNG (cached in-process after first use)
+    signature_content = await get_signature_rendition(signature)
+    public_key_b64 = await get_user_public_key(user_id)
+    
+    # Download to a working file, stamp every placement in one pass, sign the
+    # Merkle root once and upload; large documents never sit in memory
+    try:
+        return await sign_stored_document(user_id, document, signature_content, placements, public_key_b64)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.post("/apply-signature", response_model=APIResponse, dependencies=[Depends(admission_control("signing"))])
 async def apply_signature(
     request: SignatureRequest,
     user_id: str = Depends(get_current_user)
@@ -86,124 +132,267 @@ async def apply_signature(
     Apply signature to a document:
     1. Fetch document from Storage
     2. Overlay visual signature at given coordinates
-    3. Hash the document (SHA3-256)
+    3. Hash the document (SHA3-256 Merkle root over pages)
     4. Sign the hash using user's Dilithium2 private key
     5. Embed signature metadata into PDF
     """
     try:
-        # Fetch user's signature style
-        # In a real app, fetch from user profile or signatures table
-        # For this example, we'll use a placeholder URL
-        signature_path = f"signatures/{user_id}"  # This would be retrieved from the user's profile
-        
-        # Fetch document from Storage
-        # This would involve getting the document path from its ID
-        # For now, we'll use the document_id as the path (simplified)
-        document_path = f"documents/{request.document_id}"
-        document_content = await download_file("documents", document_path)
-        
-        # Create a PDF object
-        pdf_document = fitz.open(stream=document_content, filetype="pdf")
-        
-        # Get the specified page
-        page = pdf_document[request.page_number - 1]  # 0-indexed
-        
-        # Fetch the user's signature image
-        # In a real app, get from the user's profile
-        signature_content = await download_file("signatures", signature_path)
-        
-        # Create an image object from signature content
-        signature_image = Image.open(io.BytesIO(signature_content))
-        
-        # Convert image to PNG if it's not already
-        if signature_image.format != "PNG":
-            img_bytes = io.BytesIO()
-            signature_image.save(img_bytes, format="PNG")
-            img_bytes.seek(0)
-            signature_content = img_bytes.read()
-        
-        # Insert signature image at the specified coordinates
-        # The coordinates would be adapted based on page size and signature size
-        rect = fitz.Rect(request.position_x, request.position_y, 
-                         request.position_x + 200, request.position_y + 100)  # Adjust size as needed
-        page.insert_image(rect, stream=signature_content)
-        
-        # Save modified PDF to memory
-        output_stream = io.BytesIO()
-        pdf_document.save(output_stream)
-        pdf_document.close()
-        
-        # Get the modified document content
-        modified_document = output_stream.getvalue()
-        
-        # Hash the document
-        document_hash = await hash_document(modified_document)
-        
-        # Sign the hash with user's private key
-        # In a real app, the private key would be sent from the client side
-        # For this example, we'll use a placeholder
-        # private_key_b64 = "..." # This would come from the client-side securely
-        # signature_b64 = await sign_document_hash(document_hash, private_key_b64)
-        
-        # For demonstration, we'll use a placeholder signature
-        signature_b64 = base64.b64encode(b"placeholder_signature").decode('utf-8')
-        
-        # Get user's public key
+        placement = {
+            "page_number": request.page_number,
+            "position_x": request.position_x,
+            "position_y": request.position_y
+        }
+        result = await sign_document_for_user(user_id, request.document_id, request.signature_id, [placement])
+        
+        return APIResponse(
+            status="success",
+            data=result,
+            message="Document signed successfully"
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to apply signature: {str(e)}"
+        )
+
+@router.post("/apply-signatures", response_model=APIResponse, dependencies=[Depends(admission_control(
+    "signing", cost=lambda body: signing_cost(1, len(body["placements"]))
+))])
+async def apply_signatures(
+    request: MultiSignatureRequest,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Apply the same signature at many placements (e.g. initials on every page):
+    1. Fetch document from Storage
+    2. Embed the signature image once, referenced from every placement
+    3. Save, hash (Merkle root) and sign once
+    """
+    try:
+        placements = [
+            {
+                "page_number": placement.page_number,
+                "position_x": placement.position_x,
+                "position_y": placement.position_y,
+                "width": placement.width,
+                "height": placement.height
+            }
+            for placement in request.placements
+        ]
+        result = await sign_document_for_user(user_id, request.document_id, request.signature_id, placements)
+        
+        return APIResponse(
+            status="success",
+            data=result,
+            message=f"Document signed at {len(placements)} placements successfully"
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to apply signatures: {str(e)}"
+        )
+
+@router.post("/bulk-apply", dependencies=[Depends(admission_control(
+    "signing", cost=lambda body: signing_cost(len(set(body["document_ids"])), len(body["placements"]))
+))])
+async def bulk_apply_signatures(
+    request: BulkSignatureRequest,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Sign many documents with the same placement template:
+    1. Resolve every document in one query
+    2. Run download, stamp, hash, sign and upload as a pipelined job
+    3. Stream one NDJSON line per document as it finishes, then a throughput summary
+    """
+    try:
+        signature = await get_signature_record(user_id, request.signature_id)
+        if not signature:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No saved signature found"
+            )
+        
+        signature_content = await get_signature_rendition(signature)
         public_key_b64 = await get_user_public_key(user_id)
+        document_ids = list(dict.fromkeys(request.document_ids))
+        documents = await get_document_records(document_ids, user_id)
+        placements = [
+            {
+                "page_number": placement.page_number,
+                "position_x": placement.position_x,
+                "position_y": placement.position_y,
+                "width": placement.width,
+                "height": placement.height
+            }
+            for placement in request.placements
+        ]
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to start bulk signing: {str(e)}"
+        )
+    
+    async def stream_results():
+        started = time.perf_counter()
+        found_ids = {document["id"] for document in documents}
+        counts = {"signed": 0, "failed": 0, "not_found": 0}
         
-        # Create signature metadata
-        signature_metadata = {
-            "signer": user_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "public_key": public_key_b64,
-            "signature": signature_b64,
-            "hash_algorithm": "SHA3-256"
-        }
+        for document_id in document_ids:
+            if document_id not in found_ids:
+                counts["not_found"] += 1
+                yield json.dumps({"document_id": document_id, "status": "not_found"}) + "\n"
         
-        # Embed metadata into PDF
-        # In a real implementation, we'd use PyMuPDF to add this as PDF metadata
-        # For this example, we'll just return the metadata
+        async for result in bulk_sign_documents(user_id, documents, signature_content, placements, public_key_b64):
+            counts[result["status"]] += 1
+            yield json.dumps(result) + "\n"
         
-        # Upload the signed document
-        signed_document_path = f"signed_documents/{user_id}/{uuid.uuid4()}.pdf"
-        await upload_file("documents", signed_document_path, modified_document, "application/pdf")
+        elapsed = time.perf_counter() - started
+        yield json.dumps({
+            "summary": {
+                "total": len(document_ids),
+                **counts,
+                "elapsed_seconds": round(elapsed, 3),
+                "documents_per_second": round(counts["signed"] / elapsed, 2) if elapsed else None
+            }
+        }) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@router.post("/verify-page", response_model=APIResponse)
+async def verify_signed_page(
+    file: UploadFile = File(...),
+    page_number: int = Form(..., ge=1),
+    merkle_root: str = Form(..., description="merkle_root from the signature metadata"),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Verify one page of a signed PDF against the Merkle root its signature covers.
+    Only that page is rehashed; the rest of the tree comes from its proof path.
+    """
+    try:
+        if len(merkle_root) != 64 or not all(c in "0123456789abcdef" for c in merkle_root.lower()):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="merkle_root must be a hex SHA3-256 digest"
+            )
         
-        # Get signed document URL
-        signed_document_url = await get_file_url("documents", signed_document_path)
+        with signing_work_dir() as work_dir:
+            document_path = os.path.join(work_dir, "document.pdf")
+            file_size = 0
+            with open(document_path, "wb") as f:
+                while chunk := await file.read(1024 * 1024):  # 1MB chunks
+                    file_size += len(chunk)
+                    if file_size > MAX_VERIFY_FILE_SIZE:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"File too large. Maximum size: {MAX_VERIFY_FILE_SIZE / (1024 * 1024)}MB"
+                        )
+                    f.write(chunk)
+            
+            try:
+                result = await run_in_pool("pdf", verify_page_file, document_path, page_number, merkle_root.lower())
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
         
         return APIResponse(
             status="success",
-            data={
-                "signed_document_url": signed_document_url,
-                "signature_metadata": signature_metadata
-            },
-            message="Document signed successfully"
+            data=result,
+            message="Page matches the signed document" if result["valid"] else "Page does not match the signed document"
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to verify page: {str(e)}"
+        )
+
+@router.get("/list")
+async def list_signatures(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    columns: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(SIGNATURE_LIST_COLUMNS)}"),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    List saved signatures for the authenticated user, newest first, one page at a time.
+    """
+    try:
+        try:
+            page_after = decode_cursor(cursor) if cursor else None
+            projection = parse_columns(columns, SIGNATURE_LIST_COLUMNS)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        # Fetch one page (plus one row to know whether there is another) from the database
+        rows = await fetch_user_signatures(
+            user_id,
+            limit=limit,
+            cursor=page_after,
+            columns=projection,
+            created_after=created_after.isoformat() if created_after else None,
+            created_before=created_before.isoformat() if created_before else None
+        )
+        signatures, next_cursor = split_page(rows, limit)
+        
+        return StreamingResponse(
+            stream_page("signatures", signatures, next_cursor, "Signatures retrieved successfully"),
+            media_type="application/json"
         )
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to apply signature: {str(e)}"
+            detail=f"Failed to retrieve signatures: {str(e)}"
         )
 
-@router.get("/list", response_model=APIResponse)
-async def list_signatures(user_id: str = Depends(get_current_user)):
+@router.post("/bulk-delete", response_model=APIResponse)
+async def bulk_delete_signatures(
+    request: BulkDeleteRequest,
+    user_id: str = Depends(get_current_user)
+):
     """
-    List all saved signatures for the authenticated user.
+    Delete many signatures at once:
+    1. Verify ownership of every id in one query
+    2. Remove their files and renditions in one batched call
+    3. Delete the rows with a single filter and report each id's outcome
     """
     try:
-        # Fetch signatures from database
-        response = await fetch_user_signatures(user_id)
-        signatures = response.data
+        signature_ids = list(dict.fromkeys(str(signature_id) for signature_id in request.ids))
+        outcomes, rendition_paths = await delete_signatures(signature_ids, user_id)
+        for rendition_path in rendition_paths:
+            evict_signature_rendition(rendition_path)
+        deleted = sum(1 for outcome in outcomes.values() if outcome == "deleted")
         
         return APIResponse(
             status="success",
-            data={"signatures": signatures},
-            message="Signatures retrieved successfully"
+            data={
+                "results": [{"signature_id": signature_id, "status": outcome} for signature_id, outcome in outcomes.items()],
+                "deleted": deleted,
+                "not_found": len(outcomes) - deleted
+            },
+            message=f"Deleted {deleted} of {len(outcomes)} signatures"
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to retrieve signatures: {str(e)}"
+            detail=f"Failed to delete signatures: {str(e)}"
         )
 
 @router.delete("/{signature_id}", response_model=APIResponse)
@@ -226,6 +415,8 @@ async def delete_signature_endpoint(
                 detail=result.get("message", "Signature not found or access denied")
             )
         
+        evict_signature_rendition(result.get("rendition_path"))
+        
         return APIResponse(
             status="success",
             data=result,
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Form
 from app.models import VoiceQuery, VoiceResponse, APIResponse
 from app.services.ai_service import query_document
-from app.routers.auth import get_current_user
+from app.services.compute_executor import run_in_pool
+from app.routers.auth import get_current_user, admission_control
 import os
 import io
 import tempfile
@@ -22,7 +23,7 @@ whisper_model = whisper.load_model("base")
 # Configure ElevenLabs
 set_api_key(os.getenv("ELEVENLABS_API_KEY"))
 
-@router.post("/ask", response_model=APIResponse)
+@router.post("/ask", response_model=APIResponse, dependencies=[Depends(admission_control("ml"))])
 async def voice_ask(
     document_id: str = Form(...),
     audio_file: UploadFile = File(...),
@@ -49,7 +50,7 @@ async def voice_ask(
         
         try:
             # Transcribe audio to text using Whisper
-            result = whisper_model.transcribe(temp_audio_path)
+            result = await run_in_pool("ml", whisper_model.transcribe, temp_audio_path)
             transcribed_text = result["text"]
             
             # Query the document using the transcribed text
@@ -0,0 +1,200 @@
+import asyncio
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from app.services.cache import LRUCache, MISSING
+from app.services.compute_executor import get_pool
+from app.services.metrics import get_histogram
+from app.services.plans import rate_limits_for
+
+load_dotenv()
+
+# Resource class -> compute pool whose size sets the default concurrency cap
+RESOURCE_POOLS = {
+    "ml": "ml",
+    "signing": "crypto",
+}
+
+# Each plan tier as a whole may use this many users' worth of its per-user rate,
+# so a crowd of free accounts cannot take the node from paying ones
+ADMISSION_PLAN_BUCKET_USERS = int(os.getenv("ADMISSION_PLAN_BUCKET_USERS", 50))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 30))
+ADMISSION_QUEUE_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_QUEUE_RETRY_AFTER_SECONDS", 5))
+ADMISSION_MAX_TRACKED_USERS = int(os.getenv("ADMISSION_MAX_TRACKED_USERS", 100000))
+# A signed document costs one token per this many placements (rounded up)
+SIGNING_PLACEMENTS_PER_TOKEN = int(os.getenv("SIGNING_PLACEMENTS_PER_TOKEN", 10))
+
+class AdmissionRejected(Exception):
+    """A request was turned away: 429 when over its rate limit, 503 when the resource queue is full."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Allows rate tokens per second on average, with bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def retry_after(self, needed: float) -> int:
+        """Whole seconds until needed tokens are available."""
+        return max(1, math.ceil((needed - self.tokens) / self.rate))
+
+class ResourceLimiter:
+    """Caps concurrent requests of one resource class, with a bounded queue of waiters."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.queue_full = 0
+        self.queue_timeouts = 0
+        self.refunded = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._wait_time = get_histogram(f"admission.{name}.wait")
+
+    async def acquire(self):
+        # Counted rather than read off the semaphore, which only changes once a waiter is scheduled
+        if self.in_flight + self.waiting >= self.max_concurrency + self.max_queue:
+            self.queue_full += 1
+            raise AdmissionRejected(503, f"Too many {self.name} requests in progress, try again later",
+                                    ADMISSION_QUEUE_RETRY_AFTER_SECONDS)
+
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise AdmissionRejected(503, f"Timed out waiting for {self.name} capacity, try again later",
+                                    ADMISSION_QUEUE_RETRY_AFTER_SECONDS)
+        finally:
+            self.waiting -= 1
+
+        self._wait_time.observe(time.monotonic() - queued_at)
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "rejected_queue_full": self.queue_full,
+            "rejected_queue_timeout": self.queue_timeouts,
+            "refunded": self.refunded,
+            "wait_time": self._wait_time.snapshot()
+        }
+
+def _limiter(name: str, pool_name: str) -> ResourceLimiter:
+    # By default twice the pool size may be admitted, so the pool never idles between requests
+    max_concurrency = int(os.getenv(f"ADMISSION_{name.upper()}_CONCURRENCY", get_pool(pool_name).max_workers * 2))
+    max_queue = int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", max_concurrency * 4))
+    return ResourceLimiter(name, max(1, max_concurrency), max(0, max_queue))
+
+_limiters: Dict[str, ResourceLimiter] = {
+    name: _limiter(name, pool_name) for name, pool_name in RESOURCE_POOLS.items()
+}
+# (resource, user key) -> TokenBucket; an evicted bucket just comes back full
+_user_buckets = LRUCache(max_items=ADMISSION_MAX_TRACKED_USERS)
+_plan_buckets = LRUCache()
+
+def _bucket(buckets: LRUCache, key: tuple, per_minute: int) -> TokenBucket:
+    bucket = buckets.get(key)
+    # A plan change shows up as a different rate, so the bucket is rebuilt for it
+    if bucket is MISSING or bucket.capacity != per_minute:
+        bucket = TokenBucket(per_minute / 60, per_minute)
+        buckets.set(key, bucket)
+    return bucket
+
+def signing_cost(document_count: int, placement_count: int) -> int:
+    """Tokens a signing request costs: per document, scaled by placements per document."""
+    return max(1, document_count) * max(1, math.ceil(placement_count / SIGNING_PLACEMENTS_PER_TOKEN))
+
+def _take_tokens(resource: str, user_key: str, plan_name: Optional[str], cost: int) -> Tuple[TokenBucket, TokenBucket]:
+    """Spend cost tokens from both the user's and the plan tier's bucket, or raise a 429.
+
+    A request costing more than a full bucket is admitted once the bucket is
+    full and leaves it in debt, so large batches wait longer instead of never
+    fitting.
+    """
+    per_minute = rate_limits_for(plan_name)[resource]
+    user_bucket = _bucket(_user_buckets, (resource, user_key), per_minute)
+    plan_bucket = _bucket(_plan_buckets, (resource, plan_name), per_minute * ADMISSION_PLAN_BUCKET_USERS)
+
+    now = time.monotonic()
+    user_bucket.refill(now)
+    plan_bucket.refill(now)
+    for bucket in (user_bucket, plan_bucket):
+        needed = min(cost, bucket.capacity)
+        if bucket.tokens < needed:
+            _limiters[resource].rate_limited += 1
+            raise AdmissionRejected(429, f"Rate limit exceeded for {resource} requests", bucket.retry_after(needed))
+    user_bucket.tokens -= cost
+    plan_bucket.tokens -= cost
+    return user_bucket, plan_bucket
+
+async def admit(resource: str, user_key: str, plan_name: Optional[str], cost: int = 1):
+    """Admit one request of a resource class ("ml" or "signing") or raise AdmissionRejected.
+
+    cost is the number of rate limit tokens the request spends. Every
+    successful admit must be paired with release(resource).
+    """
+    limiter = _limiters.get(resource)
+    if limiter is None:
+        raise ValueError(f"Unknown admission resource: {resource}")
+    buckets = _take_tokens(resource, user_key, plan_name, cost)
+    try:
+        await limiter.acquire()
+    except AdmissionRejected:
+        # Turned away for capacity, not for the caller's own usage
+        _return_tokens(buckets, cost)
+        raise
+
+def _return_tokens(buckets, cost: int):
+    for bucket in buckets:
+        bucket.tokens = min(bucket.capacity, bucket.tokens + cost)
+
+def refund(resource: str, user_key: str, plan_name: Optional[str], cost: int = 1):
+    """Give back the tokens of an admitted request that did no work, e.g. one rejected with a 4xx.
+
+    Buckets evicted in the meantime come back full anyway, so only the ones
+    still tracked are credited.
+    """
+    _limiters[resource].refunded += 1
+    buckets = [_user_buckets.get((resource, user_key)), _plan_buckets.get((resource, plan_name))]
+    _return_tokens([bucket for bucket in buckets if bucket is not MISSING], cost)
+
+def release(resource: str):
+    """Free the concurrency slot taken by admit()."""
+    _limiters[resource].release()
+
+def admission_stats() -> Dict[str, Any]:
+    """Concurrency, queue depth and rejection counters per resource class."""
+    return {
+        "resources": {name: limiter.stats() for name, limiter in _limiters.items()},
+        "tracked_users": len(_user_buckets)
+    }
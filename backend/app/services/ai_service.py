@@ -1,11 +1,14 @@
+import asyncio
 import os
 import re
-from typing import List, Dict, Any
-import fitz  # PyMuPDF
+from typing import List, Dict, Any, Optional
 from sentence_transformers import SentenceTransformer
 import chromadb
 import google.generativeai as genai
 from dotenv import load_dotenv
+from app.services.compute_executor import run_in_pool
+from app.services.pdf_service import extract_pdf_text
+from app.services.text_extraction import extract_docx_text, extract_txt_text, extract_pdf_text_parallel, PARALLEL_EXTRACTION_MIN_PAGES
 
 load_dotenv()
 
@@ -17,19 +20,28 @@ embedding_model = SentenceTransformer('BAAI/bge-base-en-v1.5')
 chroma_client = chromadb.Client()
 collection = chroma_client.get_or_create_collection("document_chunks")
 
-async def extract_text_from_pdf(pdf_content: bytes) -> str:
+async def extract_text_from_pdf(pdf_content: bytes, page_count: Optional[int] = None) -> str:
     """
     Extract text content from a PDF document.
+    Documents known (from their upload fingerprint) to have at least
+    PARALLEL_EXTRACTION_MIN_PAGES pages are split across pdf workers.
     """
-    document = fitz.open(stream=pdf_content, filetype="pdf")
-    text = ""
-    
-    for page_num in range(len(document)):
-        page = document[page_num]
-        text += page.get_text()
-    
-    document.close()
-    return text
+    if page_count and page_count >= PARALLEL_EXTRACTION_MIN_PAGES:
+        return await extract_pdf_text_parallel(pdf_content, page_count)
+    return await run_in_pool("pdf", extract_pdf_text, pdf_content)
+
+async def extract_text(document_content: bytes, file_type: str, page_count: Optional[int] = None) -> str:
+    """
+    Extract text from an uploaded document, dispatching on its file type.
+    TXT is only decoded; DOCX body XML is stream-parsed in the pdf pool.
+    """
+    if file_type == "pdf":
+        return await extract_text_from_pdf(document_content, page_count)
+    if file_type == "docx":
+        return await run_in_pool("pdf", extract_docx_text, document_content)
+    if file_type == "txt":
+        return await asyncio.to_thread(extract_txt_text, document_content)
+    raise ValueError(f"Text extraction is not supported for {file_type} files")
 
 async def chunk_text(text: str, chunk_size: int = 600, overlap: int = 100) -> List[str]:
     """
@@ -74,7 +86,8 @@ async def generate_embeddings(chunks: List[str]) -> List[List[float]]:
     """
     Generate embeddings for text chunks using the specified model.
     """
-    return embedding_model.encode(chunks).tolist()
+    embeddings = await run_in_pool("ml", embedding_model.encode, chunks)
+    return embeddings.tolist()
 
 async def store_embeddings(document_id: str, chunks: List[str], embeddings: List[List[float]]):
     """
@@ -96,7 +109,7 @@ async def search_similar_chunks(query: str, document_id: str, k: int = 3) -> Lis
     Search for most similar chunks to a query.
     """
     # Generate embedding for the query
-    query_embedding = embedding_model.encode(query).tolist()
+    query_embedding = (await run_in_pool("ml", embedding_model.encode, query)).tolist()
     
     # Search for similar chunks in the vector database
     results = collection.query(
@@ -115,12 +128,13 @@ async def call_gemini_api(prompt: str) -> str:
     response = model.generate_content(prompt)
     return response.text
 
-async def analyze_document(document_content: bytes, document_id: str):
+async def analyze_document(document_content: bytes, document_id: str, file_type: str = "pdf",
+                           page_count: Optional[int] = None):
     """
-    Extract text from PDF, chunk it, generate embeddings, and store in vector DB.
+    Extract text from a PDF, DOCX or TXT document, chunk it, generate embeddings, and store in vector DB.
     """
     # Extract text
-    text = await extract_text_from_pdf(document_content)
+    text = await extract_text(document_content, file_type, page_count)
     
     # Chunk text
     chunks = await chunk_text(text)
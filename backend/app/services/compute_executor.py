@@ -0,0 +1,143 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from dotenv import load_dotenv
+from app.services.metrics import get_histogram
+
+load_dotenv()
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Pool name -> (executor kind, default worker count)
+# PyMuPDF is not thread-safe, so PDF work gets its own processes. liboqs (via
+# ctypes), hashlib and torch release the GIL, so crypto and ML run on threads
+# and share the models already loaded in this process.
+POOL_SPECS = {
+    "pdf": ("process", CPU_COUNT),
+    "crypto": ("thread", CPU_COUNT),
+    "ml": ("thread", max(1, CPU_COUNT // 2)),
+}
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Run fn in the worker and report when it actually started (wall clock, comparable across processes)."""
+    started_at = time.time()
+    return started_at, fn(*args, **kwargs)
+
+class ComputePool:
+    """A named executor for blocking work, with queue-depth and wait-time metrics."""
+
+    def __init__(self, name: str, kind: str, max_workers: int):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self._executor: Executor = None
+        self._wait_time = get_histogram(f"compute.{name}.wait")
+        self._run_time = get_histogram(f"compute.{name}.run")
+
+    @property
+    def executor(self) -> Executor:
+        # Created on first use so importing this module (e.g. in a pdf worker) starts nothing
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"compute-{self.name}"
+                )
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        submitted_at = time.time()
+        self.pending += 1
+        try:
+            started_at, result = await loop.run_in_executor(
+                self.executor, functools.partial(_timed_call, fn, args, kwargs)
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        finished_at = time.time()
+        self.completed += 1
+        self._wait_time.observe(started_at - submitted_at)
+        self._run_time.observe(finished_at - started_at)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "in_flight": self.pending,
+            "queue_depth": max(0, self.pending - self.max_workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_time": self._wait_time.snapshot(),
+            "run_time": self._run_time.snapshot()
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def _pool_size(name: str, default: int) -> int:
+    return max(1, int(os.getenv(f"COMPUTE_{name.upper()}_WORKERS", default)))
+
+_pools: Dict[str, ComputePool] = {
+    name: ComputePool(name, kind, _pool_size(name, default))
+    for name, (kind, default) in POOL_SPECS.items()
+}
+
+def get_pool(name: str) -> ComputePool:
+    """Return a named compute pool ("pdf", "crypto" or "ml")."""
+    try:
+        return _pools[name]
+    except KeyError:
+        raise ValueError(f"Unknown compute pool: {name}")
+
+async def run_in_pool(pool_name: str, fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call on a named pool without blocking the event loop.
+
+    Functions sent to a process pool must be importable module-level functions.
+    """
+    return await get_pool(pool_name).run(fn, *args, **kwargs)
+
+def offload(pool_name: str):
+    """Turn a blocking function into a coroutine function that runs on a thread pool.
+
+    The undecorated function stays available as `.blocking` for callers that are
+    already off the event loop.
+    """
+    if POOL_SPECS[pool_name][0] != "thread":
+        raise ValueError("offload() only supports thread pools; use run_in_pool for process pools")
+
+    def decorator(fn: Callable):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await run_in_pool(pool_name, fn, *args, **kwargs)
+        wrapper.blocking = fn
+        return wrapper
+    return decorator
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Current queue depth and latency histograms for every pool."""
+    return {name: pool.stats() for name, pool in _pools.items()}
+
+def shutdown_pools():
+    """Stop every pool; called on application shutdown."""
+    for pool in _pools.values():
+        pool.shutdown()
@@ -1,16 +1,33 @@
 import os
 import hashlib
 import base64
+import threading
+from typing import List, Tuple
 from oqs import Signature, KeyEncapsulation
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from dotenv import load_dotenv
+from app.services.compute_executor import offload
 
 load_dotenv()
 
 # Constants
 DILITHIUM_ALG = "Dilithium2"
 KYBER_ALG = "Kyber512"
+MERKLE_LEAF_PREFIX = b"\x00"
+MERKLE_NODE_PREFIX = b"\x01"
+SESSION_TOKEN_VERSION = b"\x01"
+SESSION_NONCE_SIZE = 12
+SESSION_KEY_INFO = b"signthatdoc-session-link"
 
-async def generate_dilithium_keypair():
+# Server Kyber512 keypair, loaded on first use
+_server_kem_keypair = None
+_server_kem_lock = threading.Lock()
+
+@offload("crypto")
+def generate_dilithium_keypair():
     """Generate a Dilithium2 keypair for post-quantum signatures.
     
     Returns:
@@ -26,7 +43,8 @@ async def generate_dilithium_keypair():
         
         return private_key_b64, public_key_b64
 
-async def sign_document_hash(document_hash: bytes, private_key_b64: str):
+@offload("crypto")
+def sign_document_hash(document_hash: bytes, private_key_b64: str):
     """Sign a document hash using Dilithium2 private key.
     
     Args:
@@ -46,7 +64,8 @@ async def sign_document_hash(document_hash: bytes, private_key_b64: str):
         # Encode signature as base64
         return base64.b64encode(signature).decode('utf-8')
 
-async def verify_signature(document_hash: bytes, signature_b64: str, public_key_b64: str):
+@offload("crypto")
+def verify_signature(document_hash: bytes, signature_b64: str, public_key_b64: str):
     """Verify a Dilithium2 signature.
     
     Args:
@@ -68,7 +87,8 @@ async def verify_signature(document_hash: bytes, signature_b64: str, public_key_
         except Exception:
             return False
 
-async def hash_document(file_content: bytes):
+@offload("crypto")
+def hash_document(file_content: bytes):
     """Create a SHA3-256 hash of a document.
     
     Args:
@@ -79,53 +99,191 @@ async def hash_document(file_content: bytes):
     """
     return hashlib.sha3_256(file_content).digest()
 
-async def encrypt_session_data(data: str, recipient_public_key_b64: str = None):
-    """Encrypt session data using Kyber for guest sessions.
+def hash_merkle_leaf(data: bytes):
+    """Hash a Merkle leaf, domain-separated from interior nodes.
     
     Args:
-        data: Data to encrypt (typically a session ID or document URL)
-        recipient_public_key_b64: Optional public key for recipient
+        data: Leaf content (e.g. a page's content streams)
         
     Returns:
-        tuple: (ciphertext_b64, encapsulated_key_b64)
+        bytes: SHA3-256 leaf hash
     """
-    with KeyEncapsulation(KYBER_ALG) as kem:
-        if recipient_public_key_b64:
-            public_key = base64.b64decode(recipient_public_key_b64)
-        else:
-            public_key = kem.generate_keypair()
-            
-        ciphertext, shared_secret = kem.encap_secret(public_key)
+    return hashlib.sha3_256(MERKLE_LEAF_PREFIX + data).digest()
+
+def _hash_merkle_node(left: bytes, right: bytes):
+    return hashlib.sha3_256(MERKLE_NODE_PREFIX + left + right).digest()
+
+def _merkle_levels(leaves: List[bytes]):
+    """Build every level of the tree, leaves first. An odd node is carried up unchanged."""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_hash_merkle_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+def merkle_root(leaves: List[bytes]):
+    """Compute the Merkle root over a list of leaf hashes.
+    
+    Args:
+        leaves: Leaf hashes from hash_merkle_leaf, in document order
         
-        # Use shared secret to encrypt data
-        # Simple XOR for demonstration (use a proper symmetric cipher in production)
-        data_bytes = data.encode('utf-8')
-        encrypted = bytes(a ^ b for a, b in zip(data_bytes, shared_secret * (len(data_bytes) // len(shared_secret) + 1)))
+    Returns:
+        bytes: SHA3-256 root hash
+    """
+    if not leaves:
+        raise ValueError("Cannot build a Merkle tree without leaves")
+    return _merkle_levels(leaves)[-1][0]
+
+def merkle_proof(leaves: List[bytes], index: int):
+    """Build the proof path for one leaf.
+    
+    Args:
+        leaves: Leaf hashes, in document order
+        index: Index of the leaf to prove
         
-        return (base64.b64encode(encrypted).decode('utf-8'), 
-                base64.b64encode(ciphertext).decode('utf-8'))
+    Returns:
+        list: (side, sibling_hash) pairs from the leaf up, side being "L" or "R"
+    """
+    proof: List[Tuple[str, bytes]] = []
+    for level in _merkle_levels(leaves)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(("L" if sibling < index else "R", level[sibling]))
+        index //= 2
+    return proof
 
-async def decrypt_session_data(ciphertext_b64: str, encapsulated_key_b64: str, private_key_b64: str):
-    """Decrypt session data using Kyber.
+def verify_merkle_proof(leaf: bytes, proof: List[Tuple[str, bytes]], root: bytes):
+    """Check that a leaf hash belongs to the tree with the given root.
     
     Args:
-        ciphertext_b64: Base64-encoded encrypted data
-        encapsulated_key_b64: Base64-encoded encapsulated key
-        private_key_b64: Base64-encoded private key
+        leaf: Leaf hash from hash_merkle_leaf
+        proof: Proof path from merkle_proof
+        root: Signed Merkle root
         
     Returns:
-        str: Decrypted data
+        bool: True if the proof path leads to the root
     """
-    ciphertext = base64.b64decode(ciphertext_b64)
-    encapsulated_key = base64.b64decode(encapsulated_key_b64)
-    private_key = base64.b64decode(private_key_b64)
+    node = leaf
+    for side, sibling in proof:
+        node = _hash_merkle_node(sibling, node) if side == "L" else _hash_merkle_node(node, sibling)
+    return node == root
+
+@offload("crypto")
+def generate_kyber_keypair():
+    """Generate a Kyber512 keypair, e.g. for the server's session-link key.
     
+    Returns:
+        tuple: (private_key_base64, public_key_base64)
+    """
     with KeyEncapsulation(KYBER_ALG) as kem:
-        kem.import_secret_key(private_key)
-        shared_secret = kem.decap_secret(encapsulated_key)
+        public_key = kem.generate_keypair()
+        private_key = kem.export_secret_key()
         
-        # Decrypt using shared secret
-        # Simple XOR for demonstration
-        decrypted = bytes(a ^ b for a, b in zip(ciphertext, shared_secret * (len(ciphertext) // len(shared_secret) + 1)))
+        return (base64.b64encode(private_key).decode('utf-8'),
+                base64.b64encode(public_key).decode('utf-8'))
+
+def get_server_kem_keypair():
+    """Load the server's long-lived Kyber512 keypair once per process.
+    
+    Every worker must share the configured keypair, or links issued by one
+    worker (or before a restart) would not validate on another, so a missing
+    keypair is an error rather than a reason to generate one.
+    
+    Returns:
+        tuple: (public_key, private_key) as raw bytes
+    """
+    global _server_kem_keypair
+    with _server_kem_lock:
+        if _server_kem_keypair is None:
+            public_key_b64 = os.getenv("KYBER_SERVER_PUBLIC_KEY")
+            private_key_b64 = os.getenv("KYBER_SERVER_PRIVATE_KEY")
+            if not public_key_b64 or not private_key_b64:
+                raise RuntimeError("KYBER_SERVER_PUBLIC_KEY and KYBER_SERVER_PRIVATE_KEY must be set "
+                                   "(generate them once with generate_kyber_keypair)")
+            _server_kem_keypair = (base64.b64decode(public_key_b64), base64.b64decode(private_key_b64))
+    return _server_kem_keypair
+
+def _derive_session_key(shared_secret: bytes, encapsulated_key: bytes):
+    """Derive the AES-256-GCM key from the Kyber shared secret, bound to its ciphertext."""
+    return HKDF(
+        algorithm=hashes.SHA3_256(),
+        length=32,
+        salt=encapsulated_key,
+        info=SESSION_KEY_INFO,
+    ).derive(shared_secret)
+
+def _b64url_encode(data: bytes):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+def _b64url_decode(data: str):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+@offload("crypto")
+def encrypt_session_data(data: str, recipient_public_key_b64: str = None):
+    """Encrypt session data into a compact, URL-safe token (Kyber512 + HKDF + AES-256-GCM).
+    
+    Args:
+        data: Data to encrypt (typically a session ID or document URL)
+        recipient_public_key_b64: Optional public key for recipient, defaults to the server key
         
-        return decrypted.decode('utf-8')
+    Returns:
+        str: base64url token of version || encapsulated key || nonce || AEAD ciphertext
+    """
+    if recipient_public_key_b64:
+        public_key = base64.b64decode(recipient_public_key_b64)
+    else:
+        public_key = get_server_kem_keypair()[0]
+    
+    with KeyEncapsulation(KYBER_ALG) as kem:
+        encapsulated_key, shared_secret = kem.encap_secret(public_key)
+    
+    nonce = os.urandom(SESSION_NONCE_SIZE)
+    aead = AESGCM(_derive_session_key(shared_secret, encapsulated_key))
+    ciphertext = aead.encrypt(nonce, data.encode('utf-8'), SESSION_TOKEN_VERSION)
+    
+    return _b64url_encode(SESSION_TOKEN_VERSION + encapsulated_key + nonce + ciphertext)
+
+@offload("crypto")
+def decrypt_session_data(token: str, private_key_b64: str = None):
+    """Decrypt and authenticate a session token from encrypt_session_data.
+    
+    Args:
+        token: base64url session token
+        private_key_b64: Optional private key, defaults to the server key
+        
+    Returns:
+        str: Decrypted data
+        
+    Raises:
+        ValueError: If the token is malformed or fails authentication
+    """
+    if private_key_b64:
+        private_key = base64.b64decode(private_key_b64)
+    else:
+        private_key = get_server_kem_keypair()[1]
+    
+    try:
+        raw = _b64url_decode(token)
+    except (ValueError, TypeError):
+        raise ValueError("Malformed session token")
+    
+    with KeyEncapsulation(KYBER_ALG, secret_key=private_key) as kem:
+        encapsulated_key_size = kem.details["length_ciphertext"]
+        header_size = len(SESSION_TOKEN_VERSION) + encapsulated_key_size + SESSION_NONCE_SIZE
+        if len(raw) < header_size or raw[:1] != SESSION_TOKEN_VERSION:
+            raise ValueError("Malformed session token")
+        
+        encapsulated_key = raw[1:1 + encapsulated_key_size]
+        shared_secret = kem.decap_secret(encapsulated_key)
+    
+    nonce = raw[1 + encapsulated_key_size:header_size]
+    aead = AESGCM(_derive_session_key(shared_secret, encapsulated_key))
+    try:
+        data = aead.decrypt(nonce, raw[header_size:], SESSION_TOKEN_VERSION)
+    except InvalidTag:
+        raise ValueError("Session token failed authentication")
+    
+    return data.decode('utf-8')
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+from app.services.cache import LRUCache, MISSING
+
+load_dotenv()
+
+DOCUMENT_CACHE_ENABLED = os.getenv("DOCUMENT_CACHE_ENABLED", "true").lower() == "true"
+DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "signthatdoc-objects"))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))  # on disk
+DOCUMENT_CACHE_MEMORY_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MEMORY_MAX_BYTES", 128 * 1024 * 1024))
+# Objects larger than this are served but not cached
+DOCUMENT_CACHE_MAX_OBJECT_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_OBJECT_BYTES", 32 * 1024 * 1024))
+SWEEP_EVERY_WRITES = 50
+
+_memory_cache = LRUCache(max_bytes=DOCUMENT_CACHE_MEMORY_MAX_BYTES)
+_in_flight: Dict[str, asyncio.Task] = {}
+_writes_since_sweep = 0
+_stats = {"disk_hits": 0, "downloads": 0, "coalesced": 0, "invalidations": 0}
+
+def _cache_key(bucket_name: str, file_path: str) -> str:
+    # Content-addressed paths already embed the digest, so a key never outlives its bytes;
+    # other paths are invalidated by the writes and deletes that go through supabase_service
+    return hashlib.sha256(f"{bucket_name}/{file_path}".encode("utf-8")).hexdigest()
+
+def _disk_path(key: str) -> str:
+    return os.path.join(DOCUMENT_CACHE_DIR, key[:2], key)
+
+def _read_disk(key: str) -> Optional[bytes]:
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    # Reads refresh the mtime so the sweep evicts least recently used objects first
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return content
+
+def _write_disk(key: str, content: bytes):
+    """Write an object atomically, occasionally trimming the cache back under its cap."""
+    global _writes_since_sweep
+    path = _disk_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+    _writes_since_sweep += 1
+    if _writes_since_sweep >= SWEEP_EVERY_WRITES:
+        _writes_since_sweep = 0
+        _sweep_disk()
+
+def _remove_disk(key: str):
+    try:
+        os.remove(_disk_path(key))
+    except FileNotFoundError:
+        pass
+
+def _sweep_disk():
+    """Delete least recently used objects until the cache is under DOCUMENT_CACHE_MAX_BYTES."""
+    entries, total = [], 0
+    for root, _, files in os.walk(DOCUMENT_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    for _, size, path in sorted(entries):
+        if total <= DOCUMENT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+async def _load_object(key: str, load: Callable[[], Awaitable[bytes]]) -> bytes:
+    try:
+        content = await asyncio.to_thread(_read_disk, key)
+        if content is not None:
+            _stats["disk_hits"] += 1
+        else:
+            _stats["downloads"] += 1
+            content = await load()
+            if len(content) <= DOCUMENT_CACHE_MAX_OBJECT_BYTES:
+                await asyncio.to_thread(_write_disk, key, content)
+        # An invalidation while we were loading means these bytes may already be stale
+        if _in_flight.get(key) is asyncio.current_task():
+            if len(content) <= DOCUMENT_CACHE_MAX_OBJECT_BYTES:
+                _memory_cache.set(key, content)
+        else:
+            await asyncio.to_thread(_remove_disk, key)
+        return content
+    finally:
+        if _in_flight.get(key) is asyncio.current_task():
+            del _in_flight[key]
+
+async def read_through(bucket_name: str, file_path: str, load: Callable[[], Awaitable[bytes]]) -> bytes:
+    """Return an object from memory, then disk, calling load() on a miss.
+
+    Concurrent misses for the same object share one load() call, which runs
+    as its own task so a cancelled caller does not fail the others.
+    """
+    if not DOCUMENT_CACHE_ENABLED:
+        return await load()
+
+    key = _cache_key(bucket_name, file_path)
+    content = _memory_cache.get(key)
+    if content is not MISSING:
+        return content
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_load_object(key, load))
+        _in_flight[key] = task
+    else:
+        _stats["coalesced"] += 1
+    return await asyncio.shield(task)
+
+async def invalidate(bucket_name: str, file_path: str):
+    """Forget a cached object after it was overwritten or deleted."""
+    key = _cache_key(bucket_name, file_path)
+    _stats["invalidations"] += 1
+    _in_flight.pop(key, None)
+    _memory_cache.pop(key)
+    await asyncio.to_thread(_remove_disk, key)
+
+def document_cache_stats():
+    """Hit/miss counters for both tiers."""
+    return {"memory": _memory_cache.stats(), "in_flight": len(_in_flight), **_stats}
@@ -0,0 +1,69 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, Any, Tuple
+
+# Bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, safe to observe from worker threads."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        seconds = max(seconds, 0.0)
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, bucket_count in zip(self.buckets, self.counts):
+                cumulative += bucket_count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self.count
+            return {
+                "count": self.count,
+                "sum_seconds": round(self.total, 6),
+                "max_seconds": round(self.max, 6),
+                "p50_seconds": self.quantile(0.5),
+                "p99_seconds": self.quantile(0.99),
+                "buckets": buckets
+            }
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_registry_lock = threading.Lock()
+
+def get_histogram(name: str) -> LatencyHistogram:
+    """Return the named histogram, creating it on first use."""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram())
+    return histogram
+
+def histograms_snapshot(prefix: str = "") -> Dict[str, Any]:
+    """Snapshot every histogram whose name starts with prefix."""
+    return {name: histogram.snapshot() for name, histogram in sorted(_histograms.items())
+            if name.startswith(prefix)}
@@ -0,0 +1,57 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Every page is ordered by, and resumes after, this key
+KEYSET_COLUMNS = ("created_at", "id")
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just after row in (created_at, id) descending order."""
+    payload = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Return (created_at, id) from a cursor; ValueError if it was not made by encode_cursor."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    # Both values end up in a PostgREST filter, so only accept a timestamp and a UUID
+    try:
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        uuid.UUID(row_id)
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+def parse_columns(columns: Optional[str], allowed: Tuple[str, ...]) -> List[str]:
+    """Turn a comma-separated column list into a projection; the keyset columns are always included.
+
+    Raises ValueError for columns outside the allowlist.
+    """
+    if not columns:
+        return list(allowed)
+    requested = [column.strip() for column in columns.split(",") if column.strip()]
+    unknown = [column for column in requested if column not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}. Allowed columns: {', '.join(allowed)}")
+    return list(dict.fromkeys([*KEYSET_COLUMNS, *requested]))
+
+def split_page(rows: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Rows were fetched with limit + 1; return the page and the cursor for the next one, if any."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+async def stream_page(key: str, rows: List[Dict[str, Any]], next_cursor: Optional[str], message: str) -> AsyncIterator[bytes]:
+    """Serialize a page as an APIResponse body one row at a time."""
+    yield f'{{"status":"success","message":{json.dumps(message)},"data":{{"{key}":['.encode("utf-8")
+    for index, row in enumerate(rows):
+        yield (("," if index else "") + json.dumps(row, default=str)).encode("utf-8")
+    yield f'],"next_cursor":{json.dumps(next_cursor)},"has_more":{json.dumps(next_cursor is not None)}}}}}'.encode("utf-8")
@@ -0,0 +1,494 @@
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import tempfile
+from typing import Any, Dict, List, Optional
+import fitz  # PyMuPDF
+from PIL import Image, ImageChops
+from app.services.cache import LRUCache, MISSING
+from app.services.crypto_service import hash_merkle_leaf, merkle_root, merkle_proof, verify_merkle_proof
+
+# Constants
+MERKLE_MANIFEST_NAME = "signthatdoc-merkle.json"
+SIGNATURE_WIDTH = 200
+SIGNATURE_HEIGHT = 100
+SIGNATURE_RENDER_SCALE = 2  # pixels per point, so stamps stay crisp when zoomed
+RENDER_DPI_FOR_SVG = 288
+INCREMENTAL_SAVE = os.getenv("PDF_INCREMENTAL_SAVE", "true").lower() == "true"
+OPTIMIZED_IMAGE_QUALITY = 80  # JPEG quality for images downsampled by optimize_pdf
+LOSSY_FILTERS = ("/DCTDecode", "/JPXDecode")
+STREAM_ENCODING_KEYS = ("Length", "Filter", "DecodeParms", "DL")
+INHERITABLE_PAGE_KEYS = ("Resources", "CropBox")
+NAME_TREES = ("Dests", "AP", "JavaScript", "Pages", "Templates", "IDS", "URLS", "AlternatePresentations", "Renditions")
+REFERENCE_PATTERN = re.compile(r"\b(\d+) (\d+) R\b")
+# Decoded-content digests by raw stream bytes; each entry is about 150 bytes
+MERKLE_STREAM_CACHE_MAX_ITEMS = int(os.getenv("MERKLE_STREAM_CACHE_MAX_ITEMS", 100000))
+
+_stream_digests = LRUCache(max_items=MERKLE_STREAM_CACHE_MAX_ITEMS)
+
+class _ObjectHasher:
+    """Digests of the PDF objects a leaf covers, following indirect references.
+
+    A dictionary is hashed key by key, with every reference replaced by the
+    digest of the object it points to, so a leaf changes whenever anything
+    reachable from its page changes: resources, fonts, XObjects, annotations,
+    form widgets and their appearance streams. /Parent links are not followed
+    (the page tree and field hierarchy are hashed from the catalog), and
+    references to pages hash as the page number, so each leaf stays
+    independent of the other pages.
+    """
+
+    def __init__(self, document: fitz.Document):
+        self.document = document
+        self.page_numbers = {document.page_xref(page_index): page_index for page_index in range(document.page_count)}
+        self._digests: Dict[int, bytes] = {}
+        self._stack: List[int] = []
+        self._lowest_back_reference = math.inf
+
+    def replace_references(self, text: str) -> str:
+        """Swap the "N 0 R" references in an inline dictionary or array for object digests."""
+        def digest(match):
+            xref = int(match.group(1))
+            if not 0 < xref < self.document.xref_length():
+                return match.group(0)
+            return self.digest(xref).hex()
+        return REFERENCE_PATTERN.sub(digest, text)
+
+    def entries(self, xref: int, skip_keys=()) -> List[bytes]:
+        """Hash one dictionary's entries in key order; skip_keys are left out."""
+        parts = []
+        for key in sorted(self.document.xref_get_keys(xref)):
+            if key in skip_keys:
+                continue
+            parts.append(self.entry(key, *self.document.xref_get_key(xref, key)))
+        return parts
+
+    def entry(self, key: str, kind: str, value: str) -> bytes:
+        """One dictionary entry as returned by xref_get_key, with references replaced."""
+        if kind == "xref":
+            value = self.digest(int(value.split()[0])).hex()
+        elif kind in ("dict", "array"):
+            value = self.replace_references(value)
+        return f"/{key} {kind} {value}\n".encode("utf-8")
+
+    def digest(self, xref: int) -> bytes:
+        if xref in self.page_numbers:
+            return f"page {self.page_numbers[xref]}".encode("utf-8")
+        digest = self._digests.get(xref)
+        if digest is not None:
+            return digest
+        if xref in self._stack:
+            # A cycle (e.g. outline /Next and /Prev); hash it by how far back it points
+            depth = self._stack.index(xref)
+            self._lowest_back_reference = min(self._lowest_back_reference, depth)
+            return f"cycle {len(self._stack) - depth}".encode("utf-8")
+
+        depth = len(self._stack)
+        outer_lowest, self._lowest_back_reference = self._lowest_back_reference, math.inf
+        self._stack.append(xref)
+        try:
+            if self.document.xref_is_stream(xref):
+                # Save may compress a stream, which rewrites these keys but not the content
+                parts = self.entries(xref, skip_keys=STREAM_ENCODING_KEYS)
+                parts.append(_stream_digest(self.document, xref))
+            elif self.document.xref_object(xref).lstrip().startswith("<<"):
+                parts = self.entries(xref, skip_keys=("Parent",))
+            else:
+                parts = [self.replace_references(" ".join(self.document.xref_object(xref).split())).encode("utf-8")]
+        finally:
+            self._stack.pop()
+        digest = hashlib.sha3_256(b"".join(parts)).digest()
+
+        # A digest that depends on a cycle through an object further up the
+        # stack depends on where the walk started, so it is not reused
+        if self._lowest_back_reference >= depth:
+            self._digests[xref] = digest
+        self._lowest_back_reference = min(outer_lowest, self._lowest_back_reference)
+        return digest
+
+def _stream_digest(document: fitz.Document, xref: int) -> bytes:
+    """SHA3-256 of a stream's content, unchanged when a save re-encodes the stream.
+
+    A deflating save may recompress any lossless stream, even with a different
+    filter (MuPDF turns 1-bit soft masks into CCITT fax), so those are hashed
+    decoded. Lossy image codecs are never re-encoded by a save and are hashed
+    as stored. Decoding is the expensive part, so the digest of a decoded
+    stream is cached against its raw bytes and each image is decoded once,
+    not once per signature.
+    """
+    raw = document.xref_stream_raw(xref) or b""
+    stream_filter = document.xref_get_key(xref, "Filter")[1]
+    if stream_filter == "null" or any(codec in stream_filter for codec in LOSSY_FILTERS):
+        return hashlib.sha3_256(raw).digest()
+
+    decode_parms = document.xref_get_key(xref, "DecodeParms")[1]
+    key = hashlib.sha3_256(f"{stream_filter} {decode_parms}\n".encode("utf-8") + raw).digest()
+    digest = _stream_digests.get(key)
+    if digest is MISSING:
+        digest = hashlib.sha3_256(document.xref_stream(xref) or b"").digest()
+        _stream_digests.set(key, digest)
+    return digest
+
+def _inherited_key(document: fitz.Document, xref: int, key: str):
+    """Look a page attribute up the page tree, as inheritable attributes such as /Resources may be."""
+    while xref:
+        kind, value = document.xref_get_key(xref, key)
+        if kind != "null":
+            return kind, value
+        kind, parent = document.xref_get_key(xref, "Parent")
+        xref = int(parent.split()[0]) if kind == "xref" else 0
+    return "null", "null"
+
+def hash_pdf_page(document: fitz.Document, page_index: int, hasher: Optional[_ObjectHasher] = None) -> bytes:
+    """Hash one page as a Merkle leaf: geometry and every object the page reaches.
+
+    That covers the content streams, resources (fonts, images, forms) and
+    annotations, including form widgets with their values and appearance
+    streams.
+    """
+    hasher = hasher or _ObjectHasher(document)
+    page = document[page_index]
+    parts = [f"{tuple(page.mediabox)}:{page.rotation}\n".encode("utf-8")]
+    parts.extend(hasher.entries(page.xref, skip_keys=("Parent",)))
+    keys = document.xref_get_keys(page.xref)
+    for key in INHERITABLE_PAGE_KEYS:
+        if key not in keys:
+            parts.append(hasher.entry(key, *_inherited_key(document, page.xref, key)))
+    return hash_merkle_leaf(b"".join(parts))
+
+def hash_pdf_trailer(document: fitz.Document, hasher: Optional[_ObjectHasher] = None) -> bytes:
+    """Hash the document-level leaf: page count, /Info and the catalog.
+
+    The catalog brings in the AcroForm (field values live there for fields
+    with several widgets), outlines, document actions and name trees. The
+    Merkle manifest is an embedded file, so embedded files are hashed by
+    content with the manifest left out.
+    """
+    hasher = hasher or _ObjectHasher(document)
+    catalog = document.pdf_catalog()
+    trailer = {"page_count": document.page_count, "metadata": document.metadata}
+    parts = [json.dumps(trailer, sort_keys=True).encode("utf-8")]
+    # Pages are the other leaves and /Info is the metadata above. PyMuPDF sets
+    # /PageMode on every save of a document with embedded files, the manifest included
+    parts.extend(hasher.entries(catalog, skip_keys=("Pages", "Names", "Info", "PageMode")))
+    for name_tree in NAME_TREES:
+        parts.append(hasher.entry(f"Names/{name_tree}", *document.xref_get_key(catalog, f"Names/{name_tree}")))
+    for name in sorted(document.embfile_names()):
+        if name != MERKLE_MANIFEST_NAME:
+            parts.append(name.encode("utf-8") + hashlib.sha3_256(document.embfile_get(name)).digest())
+    return hash_merkle_leaf(b"".join(parts))
+
+def read_merkle_manifest(document: fitz.Document) -> Optional[Dict[str, Any]]:
+    """The leaves recorded by the last signature, or None if there are none.
+
+    Nothing binds the manifest to the pages, so it is only good for the
+    sibling hashes of a proof, which are checked against a signed root.
+    """
+    if MERKLE_MANIFEST_NAME not in document.embfile_names():
+        return None
+    try:
+        manifest = json.loads(document.embfile_get(MERKLE_MANIFEST_NAME))
+        return {
+            "page_leaves": [bytes.fromhex(leaf) for leaf in manifest["page_leaves"]],
+            "trailer_leaf": bytes.fromhex(manifest["trailer_leaf"]),
+            "root": bytes.fromhex(manifest["root"])
+        }
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def write_merkle_manifest(document: fitz.Document, page_leaves: List[bytes], trailer_leaf: bytes, root: bytes):
+    """Embed the leaves so a single page can be verified with its proof path.
+
+    The manifest is an embedded file, which no leaf covers, so writing it
+    does not change the root. It is never trusted when signing: every
+    signature rehashes the pages.
+    """
+    manifest = json.dumps({
+        "hash_algorithm": "SHA3-256",
+        "page_leaves": [leaf.hex() for leaf in page_leaves],
+        "trailer_leaf": trailer_leaf.hex(),
+        "root": root.hex()
+    }).encode("utf-8")
+    if MERKLE_MANIFEST_NAME in document.embfile_names():
+        document.embfile_del(MERKLE_MANIFEST_NAME)
+    document.embfile_add(MERKLE_MANIFEST_NAME, manifest, filename=MERKLE_MANIFEST_NAME)
+
+def compute_merkle_tree(document: fitz.Document):
+    """Compute the per-page Merkle tree of a document from its current content.
+
+    Returns:
+        tuple: (page_leaves, trailer_leaf, root)
+    """
+    # One hasher for the whole tree, so objects shared by pages (fonts, stamps) are hashed once
+    hasher = _ObjectHasher(document)
+    page_leaves = [hash_pdf_page(document, page_index, hasher) for page_index in range(document.page_count)]
+    trailer_leaf = hash_pdf_trailer(document, hasher)
+    root = merkle_root(page_leaves + [trailer_leaf])
+    return page_leaves, trailer_leaf, root
+
+def build_page_proof(document: fitz.Document, page_index: int) -> Dict[str, Any]:
+    """Rehash one page and build its proof path from the manifest's other leaves.
+
+    Raises ValueError if the page does not exist or the document has no manifest.
+    """
+    if not 0 <= page_index < document.page_count:
+        raise ValueError(f"Page {page_index + 1} does not exist (document has {document.page_count} pages)")
+    manifest = read_merkle_manifest(document)
+    if manifest is None or len(manifest["page_leaves"]) != document.page_count:
+        raise ValueError("Document has no Merkle manifest for its pages")
+
+    page_leaf = hash_pdf_page(document, page_index)
+    leaves = manifest["page_leaves"] + [manifest["trailer_leaf"]]
+    leaves[page_index] = page_leaf
+    return {"page_leaf": page_leaf, "proof": merkle_proof(leaves, page_index)}
+
+def verify_page_file(document_path: str, page_number: int, signed_root: str) -> Dict[str, Any]:
+    """Check one page of the PDF at document_path against a signed Merkle root.
+
+    Only that page is rehashed; the rest of the tree comes from the proof
+    path, so a forged manifest can make a page fail but never pass.
+    """
+    document = fitz.open(document_path)
+    try:
+        page_proof = build_page_proof(document, page_number - 1)
+    finally:
+        document.close()
+    return {
+        "page_number": page_number,
+        "valid": verify_merkle_proof(page_proof["page_leaf"], page_proof["proof"], bytes.fromhex(signed_root)),
+        "page_leaf": page_proof["page_leaf"].hex(),
+        "proof": [[side, sibling.hex()] for side, sibling in page_proof["proof"]]
+    }
+
+def render_signature_image(image_content: bytes, extension: str) -> bytes:
+    """Normalize a signature image once into the PNG that gets stamped.
+
+    The image is converted to straight RGBA, trimmed to its ink, and scaled to
+    fit the signature rect at SIGNATURE_RENDER_SCALE, centred on a transparent
+    canvas of exactly that size, so signing never has to touch PIL.
+    """
+    if extension == "svg":
+        # PIL cannot read SVG; let MuPDF rasterize it
+        svg_document = fitz.open(stream=image_content, filetype="svg")
+        try:
+            pixmap = svg_document[0].get_pixmap(dpi=RENDER_DPI_FOR_SVG, alpha=True)
+            image = Image.open(io.BytesIO(pixmap.tobytes("png")))
+        finally:
+            svg_document.close()
+    else:
+        image = Image.open(io.BytesIO(image_content))
+
+    # Palette transparency, LA, CMYK etc. all become plain RGBA
+    image = image.convert("RGBA")
+
+    # Trim to the visible ink: by alpha if there is any transparency, else against a white background
+    alpha = image.getchannel("A")
+    if alpha.getextrema()[0] < 255:
+        bbox = alpha.getbbox()
+    else:
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        bbox = ImageChops.difference(image.convert("RGB"), background).getbbox()
+    if bbox:
+        image = image.crop(bbox)
+
+    target_size = (SIGNATURE_WIDTH * SIGNATURE_RENDER_SCALE, SIGNATURE_HEIGHT * SIGNATURE_RENDER_SCALE)
+    image.thumbnail(target_size, Image.LANCZOS)
+    canvas = Image.new("RGBA", target_size, (0, 0, 0, 0))
+    canvas.paste(image, ((target_size[0] - image.width) // 2, (target_size[1] - image.height) // 2))
+
+    img_bytes = io.BytesIO()
+    canvas.save(img_bytes, format="PNG")
+    return img_bytes.getvalue()
+
+def extract_pdf_text(pdf_content: bytes) -> str:
+    """Extract the text layer of every page, in order."""
+    document = fitz.open(stream=pdf_content, filetype="pdf")
+    try:
+        return "".join(page.get_text() for page in document)
+    finally:
+        document.close()
+
+def extract_pdf_text_range(document_path: str, start: int, stop: int) -> str:
+    """Extract the text layer of pages [start, stop) of the PDF at document_path.
+
+    Opening by path lets parallel workers share one file on disk instead of
+    each receiving a pickled copy of the document.
+    """
+    document = fitz.open(document_path)
+    try:
+        return "".join(document[page_index].get_text() for page_index in range(start, min(stop, document.page_count)))
+    finally:
+        document.close()
+
+def render_pages(document_content: bytes, page_numbers: List[int], dpi: int, image_format: str) -> Dict[int, bytes]:
+    """Rasterize pages to PNG or WebP; pages past the end of the document are skipped."""
+    pdf_document = fitz.open(stream=document_content, filetype="pdf")
+    try:
+        rendered = {}
+        for page_number in page_numbers:
+            if not 1 <= page_number <= pdf_document.page_count:
+                continue
+            pixmap = pdf_document[page_number - 1].get_pixmap(dpi=dpi)
+            if image_format == "webp":
+                # MuPDF has no WebP encoder, so hand the pixels to PIL
+                rendered[page_number] = pixmap.pil_tobytes(format="WEBP", quality=80)
+            else:
+                rendered[page_number] = pixmap.tobytes("png")
+        return rendered
+    finally:
+        pdf_document.close()
+
+def fingerprint_pdf(document_content: bytes) -> Dict[str, Any]:
+    """Collect the facts later requests need about a PDF, in one pass at upload.
+
+    Records page count, per-page size in points (rotation applied), whether
+    any page has extractable text, encryption status and the non-empty
+    document info fields. Text detection stops at the first page with text.
+    """
+    pdf_document = fitz.open(stream=document_content, filetype="pdf")
+    try:
+        if pdf_document.needs_pass:
+            # Nothing past the trailer is readable without the password
+            return {"is_encrypted": True, "page_count": None, "page_sizes": [], "has_text_layer": None, "metadata": {}}
+
+        page_sizes, has_text_layer = [], False
+        for page in pdf_document:
+            page_sizes.append([round(page.rect.width, 2), round(page.rect.height, 2)])
+            if not has_text_layer and page.get_text("text").strip():
+                has_text_layer = True
+
+        return {
+            "is_encrypted": pdf_document.is_encrypted,
+            "page_count": pdf_document.page_count,
+            "page_sizes": page_sizes,
+            "has_text_layer": has_text_layer,
+            "metadata": {key: value for key, value in (pdf_document.metadata or {}).items() if value}
+        }
+    finally:
+        pdf_document.close()
+
+def optimize_pdf(document_content: bytes, max_image_dpi: Optional[int] = None):
+    """Rewrite a PDF without unused or duplicate objects and with compressed streams.
+
+    garbage=4 drops unreferenced objects and merges identical ones, which
+    also deduplicates images embedded more than once. When max_image_dpi is
+    set, images shown above that resolution are downsampled to it (needs a
+    PyMuPDF with Document.rewrite_images). Encrypted documents and documents
+    that already carry a Merkle manifest are left untouched, as are results
+    that would not be smaller.
+
+    Returns:
+        tuple: (document_bytes, stats) where stats says whether it was optimized and why not
+    """
+    pdf_document = fitz.open(stream=document_content, filetype="pdf")
+    try:
+        if pdf_document.needs_pass or pdf_document.is_encrypted:
+            return document_content, {"optimized": False, "reason": "encrypted"}
+        if MERKLE_MANIFEST_NAME in pdf_document.embfile_names():
+            # Rewriting would drop the signed revisions and could change the hashed pages
+            return document_content, {"optimized": False, "reason": "signed"}
+
+        images_downsampled = False
+        if max_image_dpi and hasattr(pdf_document, "rewrite_images"):
+            # rewrite_images needs the threshold strictly above the target
+            pdf_document.rewrite_images(dpi_threshold=max_image_dpi + 1, dpi_target=max_image_dpi,
+                                        quality=OPTIMIZED_IMAGE_QUALITY)
+            images_downsampled = True
+
+        # Keep the /ID, so the same upload always optimizes to the same bytes and the same content digest
+        optimized = pdf_document.tobytes(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True,
+                                         no_new_id=True)
+    finally:
+        pdf_document.close()
+
+    if len(optimized) >= len(document_content):
+        return document_content, {"optimized": False, "reason": "no_reduction"}
+    return optimized, {"optimized": True, "images_downsampled": images_downsampled}
+
+def overlay_signature_file(document_path: str, signature_content: bytes, placements: List[Dict[str, Any]]):
+    """Stamp a PNG signature at one or more placements of the PDF at document_path, in place.
+
+    The document is opened by path, so MuPDF reads only the objects it needs
+    rather than the whole file. The image is embedded once and every further
+    placement references the same image XObject, so the output grows by one
+    image however many pages are stamped. Each placement is a dict with
+    page_number, position_x, position_y and optional width/height (points).
+
+    With incremental saving the stamps are appended as a PDF incremental update,
+    so the original bytes (and any earlier signer's byte ranges) stay untouched
+    and only the delta is written.
+
+    Returns:
+        dict: merkle_info with the signed root and save statistics
+    """
+    original_size = os.path.getsize(document_path)
+    pdf_document = fitz.open(document_path)
+    try:
+        image_xref = 0
+        for placement in placements:
+            page_index = placement["page_number"] - 1  # 0-indexed
+            if not 0 <= page_index < pdf_document.page_count:
+                raise ValueError(f"Page {placement['page_number']} does not exist "
+                                 f"(document has {pdf_document.page_count} pages)")
+
+            # Insert signature image at the specified coordinates
+            x, y = placement["position_x"], placement["position_y"]
+            rect = fitz.Rect(x, y, x + (placement.get("width") or SIGNATURE_WIDTH),
+                             y + (placement.get("height") or SIGNATURE_HEIGHT))
+            if image_xref:
+                pdf_document[page_index].insert_image(rect, xref=image_xref)
+            else:
+                image_xref = pdf_document[page_index].insert_image(rect, stream=signature_content)
+
+        page_leaves, trailer_leaf, root = compute_merkle_tree(pdf_document)
+        write_merkle_manifest(pdf_document, page_leaves, trailer_leaf, root)
+
+        incremental = save_signed_document(pdf_document, document_path)
+    finally:
+        pdf_document.close()
+
+    signed_size = os.path.getsize(document_path)
+    return {
+        "merkle_root": root.hex(),
+        "page_count": len(page_leaves),
+        "placements": len(placements),
+        "incremental": incremental,
+        "delta_bytes": signed_size - original_size if incremental else signed_size
+    }
+
+def overlay_signature(document_content: bytes, signature_content: bytes, placements: List[Dict[str, Any]]):
+    """In-memory variant of overlay_signature_file.
+
+    Returns:
+        tuple: (modified_document_bytes, merkle_info)
+    """
+    with tempfile.TemporaryDirectory(prefix="signthatdoc-") as work_dir:
+        document_path = os.path.join(work_dir, "document.pdf")
+        with open(document_path, "wb") as f:
+            f.write(document_content)
+
+        merkle_info = overlay_signature_file(document_path, signature_content, placements)
+
+        with open(document_path, "rb") as f:
+            return f.read(), merkle_info
+
+def save_signed_document(pdf_document: fitz.Document, document_path: str) -> bool:
+    """Save a document opened from document_path back to that path.
+
+    Appends an incremental update when possible; falls back to a full rewrite
+    (e.g. for a file MuPDF had to repair on open).
+
+    Returns:
+        bool: True if the save was incremental
+    """
+    if INCREMENTAL_SAVE and pdf_document.can_save_incrementally():
+        pdf_document.save(document_path, incremental=True, deflate=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        return True
+
+    rewritten_path = document_path + ".full"
+    pdf_document.save(rewritten_path, deflate=True)
+    os.replace(rewritten_path, document_path)
+    return False
@@ -0,0 +1,26 @@
+from typing import Dict, Optional
+
+FREE_PLAN_NAME = "Free"
+FREE_PLAN_DOCUMENT_LIMIT = 3
+# Requests per minute per user, by admission resource class
+FREE_PLAN_RATE_LIMITS = {"ml": 6, "signing": 20}
+
+# Plan ID -> display name, document limit and rate limits
+PLAN_DETAILS = {
+    "creator": {"name": "Creator Plan", "document_limit": 10, "rate_limits": {"ml": 20, "signing": 60}},
+    "pro": {"name": "Pro Plan", "document_limit": 100, "rate_limits": {"ml": 60, "signing": 240}},
+    "premium": {"name": "Premium Plan", "document_limit": 250, "rate_limits": {"ml": 120, "signing": 600}},
+    "payg": {"name": "Pay As You Go", "document_limit": 1, "rate_limits": FREE_PLAN_RATE_LIMITS},
+}
+
+# Subscriptions store the display name, so limits are also looked up by name
+_LIMITS_BY_NAME = {details["name"]: details["document_limit"] for details in PLAN_DETAILS.values()}
+_RATE_LIMITS_BY_NAME = {details["name"]: details["rate_limits"] for details in PLAN_DETAILS.values()}
+
+def document_limit_for(plan_name: Optional[str]) -> int:
+    """Document limit of a plan by its display name; unknown plans get the free tier limit."""
+    return _LIMITS_BY_NAME.get(plan_name, FREE_PLAN_DOCUMENT_LIMIT)
+
+def rate_limits_for(plan_name: Optional[str]) -> Dict[str, int]:
+    """Per-user requests per minute of a plan by its display name; unknown plans get the free tier limits."""
+    return _RATE_LIMITS_BY_NAME.get(plan_name, FREE_PLAN_RATE_LIMITS)
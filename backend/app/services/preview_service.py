@@ -0,0 +1,112 @@
+import asyncio
+import os
+import tempfile
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from app.services.cache import LRUCache, MISSING
+from app.services.compute_executor import run_in_pool
+from app.services.pdf_service import render_pages
+from app.services.supabase_service import download_file, resolve_document_path
+
+load_dotenv()
+
+PREVIEW_CACHE_DIR = os.getenv("PREVIEW_CACHE_DIR", os.path.join(tempfile.gettempdir(), "signthatdoc-previews"))
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", 1024 * 1024 * 1024))  # on disk
+PREVIEW_MEMORY_MAX_BYTES = int(os.getenv("PREVIEW_MEMORY_MAX_BYTES", 64 * 1024 * 1024))
+PREVIEW_PRERENDER_PAGES = int(os.getenv("PREVIEW_PRERENDER_PAGES", 3))
+DEFAULT_PREVIEW_DPI = 96
+PREVIEW_FORMATS = {"png": "image/png", "webp": "image/webp"}
+SWEEP_EVERY_WRITES = 100
+
+_memory_cache = LRUCache(max_bytes=PREVIEW_MEMORY_MAX_BYTES)
+_writes_since_sweep = 0
+
+def _cache_key(document: Dict[str, Any], page_number: int, dpi: int, image_format: str) -> str:
+    # The content digest changes whenever the bytes do, so cached tiles never go stale
+    digest = document.get("content_digest") or document["id"]
+    return f"{digest[:2]}/{digest}/{page_number}-{dpi}.{image_format}"
+
+def _read_tile(key: str) -> Optional[bytes]:
+    try:
+        with open(os.path.join(PREVIEW_CACHE_DIR, key), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write_tiles(tiles: Dict[str, bytes]):
+    """Write tiles atomically, occasionally trimming the disk cache back under its cap."""
+    global _writes_since_sweep
+    for key, tile in tiles.items():
+        path = os.path.join(PREVIEW_CACHE_DIR, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(tile)
+        os.replace(tmp_path, path)
+
+    _writes_since_sweep += len(tiles)
+    if _writes_since_sweep >= SWEEP_EVERY_WRITES:
+        _writes_since_sweep = 0
+        _sweep_disk_cache()
+
+def _sweep_disk_cache():
+    """Delete least recently written tiles until the cache is under PREVIEW_CACHE_MAX_BYTES."""
+    entries, total = [], 0
+    for root, _, files in os.walk(PREVIEW_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    for _, size, path in sorted(entries):
+        if total <= PREVIEW_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+async def _render_and_cache(document: Dict[str, Any], document_content: bytes, page_numbers, dpi: int, image_format: str):
+    rendered = await run_in_pool("pdf", render_pages, document_content, page_numbers, dpi, image_format)
+    tiles = {_cache_key(document, page_number, dpi, image_format): tile for page_number, tile in rendered.items()}
+    for key, tile in tiles.items():
+        _memory_cache.set(key, tile)
+    await asyncio.to_thread(_write_tiles, tiles)
+    return rendered
+
+async def get_page_preview(document: Dict[str, Any], page_number: int, dpi: int = DEFAULT_PREVIEW_DPI,
+                           image_format: str = "png") -> Optional[bytes]:
+    """Return a rendered page from memory, then disk, rendering it on a miss. None if the page does not exist."""
+    page_count = (document.get("fingerprint") or {}).get("page_count")
+    if page_count is not None and page_number > page_count:
+        return None
+
+    key = _cache_key(document, page_number, dpi, image_format)
+
+    tile = _memory_cache.get(key)
+    if tile is not MISSING:
+        return tile
+
+    tile = await asyncio.to_thread(_read_tile, key)
+    if tile is not None:
+        _memory_cache.set(key, tile)
+        return tile
+
+    document_content = await download_file("documents", resolve_document_path(document))
+    rendered = await _render_and_cache(document, document_content, [page_number], dpi, image_format)
+    return rendered.get(page_number)
+
+async def prerender_previews(document: Dict[str, Any], document_content: bytes):
+    """Render the first pages right after upload so the signing UI opens on a warm cache."""
+    try:
+        page_count = (document.get("fingerprint") or {}).get("page_count") or PREVIEW_PRERENDER_PAGES
+        pages = list(range(1, min(PREVIEW_PRERENDER_PAGES, page_count) + 1))
+        await _render_and_cache(document, document_content, pages, DEFAULT_PREVIEW_DPI, "png")
+    except Exception as e:
+        # Previews are an optimization; a failure here must not affect the upload
+        print(f"Error pre-rendering previews for {document['id']}: {str(e)}")
@@ -0,0 +1,62 @@
+import os
+from typing import Dict, Any
+from dotenv import load_dotenv
+from app.services.cache import LRUCache, MISSING
+from app.services.compute_executor import run_in_pool
+from app.services.crypto_service import hash_document
+from app.services.pdf_service import render_signature_image
+from app.services.supabase_service import upload_file, download_file
+
+load_dotenv()
+
+SIGNATURES_BUCKET = "signatures"
+SIGNATURE_CACHE_MAX_BYTES = int(os.getenv("SIGNATURE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Pre-rendered signature PNGs, keyed by storage path (or content digest for guest uploads)
+_rendition_cache = LRUCache(max_bytes=SIGNATURE_CACHE_MAX_BYTES)
+
+def rendition_path_for(original_path: str) -> str:
+    """Storage path of the rendition stored next to an original signature file."""
+    return f"{original_path.rsplit('.', 1)[0]}.render.png"
+
+async def create_signature_rendition(original_path: str, content: bytes, extension: str) -> str:
+    """Render a newly saved signature once, store it next to the original and cache it."""
+    rendition = await run_in_pool("pdf", render_signature_image, content, extension)
+    rendition_path = rendition_path_for(original_path)
+    await upload_file(SIGNATURES_BUCKET, rendition_path, rendition, "image/png")
+    _rendition_cache.set(rendition_path, rendition)
+    return rendition_path
+
+async def get_signature_rendition(signature: Dict[str, Any]) -> bytes:
+    """Return the stamp-ready PNG for a saved signature row, without PIL work when cached."""
+    rendition_path = signature.get("rendition_path")
+    cache_key = rendition_path or signature["signature_url"]
+
+    rendition = _rendition_cache.get(cache_key)
+    if rendition is not MISSING:
+        return rendition
+
+    if rendition_path:
+        rendition = await download_file(SIGNATURES_BUCKET, rendition_path)
+    else:
+        # Signature saved before renditions existed: render from the original, once per process
+        file_name = signature["signature_url"].split("/")[-1].split("?")[0]
+        original = await download_file(SIGNATURES_BUCKET, f"signatures/{signature['user_id']}/{file_name}")
+        rendition = await run_in_pool("pdf", render_signature_image, original, file_name.split(".")[-1].lower())
+
+    _rendition_cache.set(cache_key, rendition)
+    return rendition
+
+async def render_uploaded_signature(content: bytes, extension: str) -> bytes:
+    """Render a one-off signature upload (guest signing), reusing the result for identical files."""
+    cache_key = (await hash_document(content)).hex()
+    rendition = _rendition_cache.get(cache_key)
+    if rendition is MISSING:
+        rendition = await run_in_pool("pdf", render_signature_image, content, extension)
+        _rendition_cache.set(cache_key, rendition)
+    return rendition
+
+def evict_signature_rendition(rendition_path: str):
+    """Drop a deleted signature's rendition from the in-process cache."""
+    if rendition_path:
+        _rendition_cache.pop(rendition_path)
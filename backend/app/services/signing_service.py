@@ -0,0 +1,183 @@
+import asyncio
+import base64
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+from app.services.compute_executor import run_in_pool, get_pool
+from app.services.pdf_service import overlay_signature_file
+from app.services.supabase_service import download_file, download_file_to_path, upload_file, upload_file_from_path, get_file_url, resolve_document_path
+
+load_dotenv()
+
+# Per-stage concurrency for bulk jobs; stamping and signing default to their pool sizes
+BULK_DOWNLOAD_CONCURRENCY = int(os.getenv("BULK_DOWNLOAD_CONCURRENCY", 8))
+BULK_UPLOAD_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", 8))
+BULK_STAMP_CONCURRENCY = int(os.getenv("BULK_STAMP_CONCURRENCY", get_pool("pdf").max_workers))
+BULK_SIGN_CONCURRENCY = int(os.getenv("BULK_SIGN_CONCURRENCY", get_pool("crypto").max_workers))
+
+# Documents at or above this size are streamed to and from disk instead of held in memory
+LARGE_DOCUMENT_THRESHOLD = int(os.getenv("LARGE_DOCUMENT_THRESHOLD", 4 * 1024 * 1024))
+# Where per-request working files go; defaults to the system temp directory
+SIGNING_WORK_DIR = os.getenv("SIGNING_WORK_DIR") or None
+
+def is_large_document(document: Dict[str, Any]) -> bool:
+    """Whether a document row should take the disk-backed path (unknown sizes count as small)."""
+    return (document.get("file_size") or 0) >= LARGE_DOCUMENT_THRESHOLD
+
+def signing_work_dir():
+    """Temporary directory for one document's working files, removed on exit."""
+    return tempfile.TemporaryDirectory(prefix="signthatdoc-sign-", dir=SIGNING_WORK_DIR)
+
+def validate_placements(document: Dict[str, Any], placements: List[Dict[str, Any]]):
+    """Reject placements on pages the document does not have, using the upload fingerprint.
+
+    Documents uploaded before fingerprints existed are checked when stamped instead.
+    """
+    page_count = (document.get("fingerprint") or {}).get("page_count")
+    if page_count is None:
+        return
+    for placement in placements:
+        if not 1 <= placement["page_number"] <= page_count:
+            raise ValueError(f"Page {placement['page_number']} does not exist "
+                             f"(document has {page_count} pages)")
+
+async def fetch_document_to_path(document: Dict[str, Any], destination_path: str):
+    """Put a stored document's bytes at destination_path, streaming large ones straight to disk."""
+    storage_path = resolve_document_path(document)
+    if is_large_document(document):
+        await download_file_to_path("documents", storage_path, destination_path)
+        return
+    document_content = await download_file("documents", storage_path)
+    with open(destination_path, "wb") as f:
+        f.write(document_content)
+
+async def stamp_document_file(document_path: str, signature_content: bytes, placements: List[Dict[str, Any]]):
+    """Stamp the PDF at document_path in place in the pdf pool; returns merkle_info.
+
+    Only the path crosses the process boundary, so the document bytes are
+    never pickled or copied into the worker.
+    """
+    return await run_in_pool("pdf", overlay_signature_file, document_path, signature_content, placements)
+
+async def sign_merkle_root(user_id: str, merkle_info: Dict[str, Any], public_key_b64: Optional[str]):
+    """Sign the document's Merkle root and build the signature metadata."""
+    # The signature covers the Merkle root of every page and the trailer
+    document_hash = bytes.fromhex(merkle_info["merkle_root"])
+
+    # Sign the hash with user's private key
+    # In a real app, the private key would be sent from the client side
+    # For this example, we'll use a placeholder
+    # private_key_b64 = "..." # This would come from the client-side securely
+    # signature_b64 = await sign_document_hash(document_hash, private_key_b64)
+
+    # For demonstration, we'll use a placeholder signature
+    signature_b64 = base64.b64encode(b"placeholder_signature").decode('utf-8')
+
+    return {
+        "signer": user_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "public_key": public_key_b64,
+        "signature": signature_b64,
+        "hash_algorithm": "SHA3-256-Merkle",
+        "merkle_root": merkle_info["merkle_root"],
+        "page_count": merkle_info["page_count"],
+        "placements": merkle_info["placements"]
+    }
+
+async def upload_signed_document(folder: str, modified_document: bytes) -> str:
+    """Upload a signed document under folder (e.g. signed_documents/<user_id>) and return its URL."""
+    signed_document_path = f"{folder}/{uuid.uuid4()}.pdf"
+    await upload_file("documents", signed_document_path, modified_document, "application/pdf")
+    return await get_file_url("documents", signed_document_path)
+
+async def upload_signed_file(folder: str, document_path: str, large: bool) -> str:
+    """Upload a signed document from disk under folder and return its URL, streaming it when large."""
+    if not large:
+        with open(document_path, "rb") as f:
+            return await upload_signed_document(folder, f.read())
+    signed_document_path = f"{folder}/{uuid.uuid4()}.pdf"
+    await upload_file_from_path("documents", signed_document_path, document_path, "application/pdf")
+    return await get_file_url("documents", signed_document_path)
+
+async def sign_stored_document(user_id: str, document: Dict[str, Any], signature_content: bytes,
+                               placements: List[Dict[str, Any]], public_key_b64: Optional[str]) -> Dict[str, Any]:
+    """Download, stamp, sign and upload one stored document through a working file.
+
+    The document only ever exists as a file: MuPDF opens it by path, the
+    stamps are saved back into it and the upload reads it from disk, so peak
+    memory per request does not grow with the size of large documents.
+    Raises ValueError for placements on pages the document does not have.
+    """
+    validate_placements(document, placements)
+    large = is_large_document(document)
+    with signing_work_dir() as work_dir:
+        document_path = os.path.join(work_dir, "document.pdf")
+        await fetch_document_to_path(document, document_path)
+        merkle_info = await stamp_document_file(document_path, signature_content, placements)
+        signature_metadata = await sign_merkle_root(user_id, merkle_info, public_key_b64)
+        signed_document_url = await upload_signed_file(f"signed_documents/{user_id}", document_path, large)
+    return {
+        "signed_document_url": signed_document_url,
+        "signature_metadata": signature_metadata
+    }
+
+async def bulk_sign_documents(user_id: str, documents: List[Dict[str, Any]], signature_content: bytes,
+                              placements: List[Dict[str, Any]], public_key_b64: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+    """Sign many documents as a pipeline, yielding each result as soon as it finishes.
+
+    Every document moves through download -> stamp -> sign -> upload on its own
+    task, and each stage has its own concurrency limit, so downloads overlap
+    with stamping and uploads instead of running one document at a time. A
+    document only starts downloading when a download slot is free, which also
+    bounds how many documents are in progress. Each document is worked on in
+    its own temporary file, so large documents are never held in memory.
+    """
+    download_slots = asyncio.Semaphore(BULK_DOWNLOAD_CONCURRENCY)
+    stamp_slots = asyncio.Semaphore(BULK_STAMP_CONCURRENCY)
+    sign_slots = asyncio.Semaphore(BULK_SIGN_CONCURRENCY)
+    upload_slots = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+    # Documents downloaded but not yet uploaded
+    in_flight = asyncio.Semaphore(BULK_DOWNLOAD_CONCURRENCY + BULK_STAMP_CONCURRENCY + BULK_UPLOAD_CONCURRENCY)
+
+    async def process(document: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            validate_placements(document, placements)
+            async with in_flight:
+                with signing_work_dir() as work_dir:
+                    document_path = os.path.join(work_dir, "document.pdf")
+                    async with download_slots:
+                        await fetch_document_to_path(document, document_path)
+                    async with stamp_slots:
+                        merkle_info = await stamp_document_file(document_path, signature_content, placements)
+                    async with sign_slots:
+                        signature_metadata = await sign_merkle_root(user_id, merkle_info, public_key_b64)
+                    async with upload_slots:
+                        signed_document_url = await upload_signed_file(f"signed_documents/{user_id}", document_path, is_large_document(document))
+            return {
+                "document_id": document["id"],
+                "status": "signed",
+                "signed_document_url": signed_document_url,
+                "signature_metadata": signature_metadata,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+        except Exception as e:
+            return {
+                "document_id": document["id"],
+                "status": "failed",
+                "error": str(e),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+
+    tasks = [asyncio.create_task(process(document)) for document in documents]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # Client went away: stop the remaining documents
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,129 @@
+import asyncio
+import mmap
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from typing import List, Optional
+from urllib.parse import quote
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_LOCAL_ROOT = os.path.abspath(os.getenv("STORAGE_LOCAL_ROOT", "local_storage"))
+# Base of the URLs handed out for locally stored files (e.g. a static file server in front of the root)
+STORAGE_LOCAL_PUBLIC_URL = os.getenv("STORAGE_LOCAL_PUBLIC_URL", f"file://{STORAGE_LOCAL_ROOT}")
+
+class StorageBackend(ABC):
+    """Object storage used by supabase_service: buckets of files addressed by path."""
+
+    # Whether downloads are worth keeping in the local document cache
+    cacheable = True
+
+    @abstractmethod
+    async def upload(self, bucket_name: str, file_path: str, content: bytes, content_type: Optional[str] = None,
+                     upsert: bool = False):
+        """Store content at bucket/file_path; with upsert an existing object is overwritten."""
+
+    @abstractmethod
+    async def upload_from_path(self, bucket_name: str, file_path: str, source_path: str,
+                               content_type: Optional[str] = None):
+        """Store the file at source_path without reading it all into memory."""
+
+    @abstractmethod
+    async def download(self, bucket_name: str, file_path: str) -> bytes:
+        """Return the bytes stored at bucket/file_path."""
+
+    @abstractmethod
+    async def download_to_path(self, bucket_name: str, file_path: str, destination_path: str):
+        """Write the object at bucket/file_path to destination_path without holding it in memory."""
+
+    @abstractmethod
+    async def exists(self, bucket_name: str, file_path: str) -> bool:
+        """Whether an object is stored at bucket/file_path."""
+
+    @abstractmethod
+    async def remove(self, bucket_name: str, file_paths: List[str]):
+        """Delete objects; missing ones are ignored."""
+
+    @abstractmethod
+    async def public_url(self, bucket_name: str, file_path: str) -> str:
+        """URL a client can fetch the object from."""
+
+class LocalStorageBackend(StorageBackend):
+    """Filesystem storage for offline development and load testing.
+
+    Buckets are directories under root. Reads are served from a memory map of
+    the file, and writes go to a temporary file in the same directory that is
+    renamed into place, so readers never see a partial object.
+    """
+
+    cacheable = False  # already local, caching would only copy it again
+
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT, public_url_base: str = STORAGE_LOCAL_PUBLIC_URL):
+        self.root = root
+        self.public_url_base = public_url_base.rstrip("/")
+
+    def _path(self, bucket_name: str, file_path: str) -> str:
+        bucket_root = os.path.join(self.root, bucket_name)
+        path = os.path.abspath(os.path.join(bucket_root, file_path))
+        if os.path.commonpath([bucket_root, path]) != bucket_root:
+            raise ValueError(f"Invalid storage path: {file_path}")
+        return path
+
+    def _write_atomic(self, path: str, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _read_mapped(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+
+    def _copy_into(self, source_path: str, destination_path: str):
+        with open(source_path, "rb") as source:
+            self._write_atomic(destination_path, lambda f: shutil.copyfileobj(source, f))
+
+    def _remove(self, paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def upload(self, bucket_name: str, file_path: str, content: bytes, content_type: Optional[str] = None,
+                     upsert: bool = False):
+        # Writes always replace atomically, so upsert needs no special handling
+        path = self._path(bucket_name, file_path)
+        await asyncio.to_thread(self._write_atomic, path, lambda f: f.write(content))
+        return {"path": file_path}
+
+    async def upload_from_path(self, bucket_name: str, file_path: str, source_path: str,
+                               content_type: Optional[str] = None):
+        await asyncio.to_thread(self._copy_into, source_path, self._path(bucket_name, file_path))
+        return {"path": file_path}
+
+    async def download(self, bucket_name: str, file_path: str) -> bytes:
+        return await asyncio.to_thread(self._read_mapped, self._path(bucket_name, file_path))
+
+    async def download_to_path(self, bucket_name: str, file_path: str, destination_path: str):
+        await asyncio.to_thread(shutil.copyfile, self._path(bucket_name, file_path), destination_path)
+
+    async def exists(self, bucket_name: str, file_path: str) -> bool:
+        return await asyncio.to_thread(os.path.isfile, self._path(bucket_name, file_path))
+
+    async def remove(self, bucket_name: str, file_paths: List[str]):
+        await asyncio.to_thread(self._remove, [self._path(bucket_name, file_path) for file_path in file_paths])
+        return [{"name": file_path} for file_path in file_paths]
+
+    async def public_url(self, bucket_name: str, file_path: str) -> str:
+        return f"{self.public_url_base}/{quote(bucket_name)}/{quote(file_path)}"
@@ -1,71 +1,506 @@
+import asyncio
+import inspect
 import os
-from supabase import create_client, Client
+import time
+import uuid
+from collections import Counter
+import httpx
+from supabase import acreate_client, AsyncClient
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+from app.services.metrics import get_histogram
+from app.services import document_cache
+from app.services.storage_backends import StorageBackend, LocalStorageBackend
+from app.services.pagination import DEFAULT_PAGE_SIZE
+from app.services.cache import LRUCache, MISSING
+from app.services.plans import FREE_PLAN_NAME, FREE_PLAN_DOCUMENT_LIMIT, document_limit_for
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+
+DOCUMENTS_BUCKET = "documents"
+CONTENT_OBJECT_PREFIX = "objects"
+SIGNED_URL_TTL_SECONDS = 300
+STREAM_CHUNK_SIZE = 1024 * 1024
+STREAM_TIMEOUT_SECONDS = 120
+
+# /profile/get runs on every page load; profiles are cached briefly and invalidated on change
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", 30))
+PROFILE_CACHE_MAX_ITEMS = int(os.getenv("PROFILE_CACHE_MAX_ITEMS", 10000))
+
+# Public keys rarely change; the TTL only bounds how long another worker can serve a rotated key
+PUBLIC_KEY_CACHE_MAX_ITEMS = int(os.getenv("PUBLIC_KEY_CACHE_MAX_ITEMS", 50000))
+PUBLIC_KEY_CACHE_TTL_SECONDS = float(os.getenv("PUBLIC_KEY_CACHE_TTL_SECONDS", 3600))
+PUBLIC_KEY_NEGATIVE_TTL_SECONDS = float(os.getenv("PUBLIC_KEY_NEGATIVE_TTL_SECONDS", 60))
+
+# Columns clients may ask for when listing
+DOCUMENT_LIST_COLUMNS = ("id", "file_name", "file_type", "file_url", "is_signed", "created_at", "updated_at",
+                         "content_digest", "file_size", "fingerprint")
+SIGNATURE_LIST_COLUMNS = ("id", "signature_url", "rendition_path", "created_at")
+
+# Calls in flight to Supabase from this worker, and how long each may take
+SUPABASE_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", 32))
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", 10))
+SUPABASE_STORAGE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_STORAGE_TIMEOUT_SECONDS", 60))
+SUPABASE_KEEPALIVE_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_SECONDS", 30))
+
+# Where files live: "supabase" (Supabase Storage) or "local" (filesystem, for offline load tests)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+
+# One async client per process; its PostgREST, Storage and Auth sub-clients each
+# keep a pooled keep-alive httpx connection pool for the life of the worker
+_client: Optional[AsyncClient] = None
+_client_lock = asyncio.Lock()
+_http_client: Optional[httpx.AsyncClient] = None
+_call_slots = asyncio.Semaphore(SUPABASE_MAX_CONCURRENCY)
+_profile_cache = LRUCache(max_items=PROFILE_CACHE_MAX_ITEMS, ttl=PROFILE_CACHE_TTL_SECONDS)
+_public_key_cache = LRUCache(max_items=PUBLIC_KEY_CACHE_MAX_ITEMS, ttl=PUBLIC_KEY_CACHE_TTL_SECONDS)
+
+async def get_client() -> AsyncClient:
+    """Return the shared async Supabase client, creating it on first use."""
+    global _client
+    if _client is None:
+        async with _client_lock:
+            if _client is None:
+                _client = await acreate_client(supabase_url, supabase_key)
+    return _client
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Shared pooled client for streaming transfers that bypass the storage SDK."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=STREAM_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=SUPABASE_MAX_CONCURRENCY,
+                                max_keepalive_connections=SUPABASE_MAX_CONCURRENCY,
+                                keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS)
+        )
+    return _http_client
+
+async def _close_sub_clients(client: AsyncClient):
+    """Close the connection pools of every sub-client the Supabase client has opened."""
+    # PostgREST, Storage and Functions are created on first use; the public
+    # properties would open a fresh client just to close it, so read the private slots
+    for sub_client in (client._postgrest, client._storage, client._functions):
+        if sub_client is None:
+            continue
+        if hasattr(sub_client, "aclose"):
+            await sub_client.aclose()
+            continue
+        session = getattr(sub_client, "session", None) or getattr(sub_client, "_client", None)
+        if isinstance(session, httpx.AsyncClient):
+            await session.aclose()
+    await client.auth.close()
+
+async def close_client():
+    """Close pooled connections; called on application shutdown."""
+    global _client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _client is not None:
+        client, _client = _client, None
+        await _close_sub_clients(client)
+
+async def _execute(operation: str, call: Callable[[AsyncClient], Awaitable], timeout: float = SUPABASE_TIMEOUT_SECONDS):
+    """Run one Supabase call with bounded concurrency, a timeout and a latency histogram.
+
+    call receives the client and returns the awaitable to run, so nothing is
+    sent until a slot is free. Latency is recorded as supabase.<operation>.
+    """
+    client = await get_client()
+    async with _call_slots:
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(call(client), timeout)
+        finally:
+            get_histogram(f"supabase.{operation}").observe(time.perf_counter() - started)
+
+def _file_options(content_type: Optional[str], upsert: bool = False) -> Optional[Dict[str, str]]:
+    options = {"content-type": content_type} if content_type else {}
+    if upsert:
+        options["upsert"] = "true"
+    return options or None
 
 async def register_user(email: str, password: str):
     """Register a new user with Supabase Auth."""
-    return supabase.auth.sign_up({
+    return await _execute("auth.sign_up", lambda db: db.auth.sign_up({
         "email": email,
         "password": password,
-    })
+    }))
 
 async def login_user(email: str, password: str):
     """Authenticate a user with Supabase Auth."""
-    return supabase.auth.sign_in_with_password({
+    return await _execute("auth.sign_in", lambda db: db.auth.sign_in_with_password({
         "email": email,
         "password": password
-    })
+    }))
 
 async def store_user_public_key(user_id: str, public_key: str):
-    """Store the user's public key in the database."""
-    return supabase.table("user_keys").insert({
+    """Store the user's public key in the database (a new row rotates the key)."""
+    response = await _execute("user_keys.insert", lambda db: db.table("user_keys").insert({
         "user_id": user_id,
         "public_key": public_key
-    }).execute()
+    }).execute())
+    invalidate_user_public_key(user_id)
+    _public_key_cache.set(user_id, public_key)
+    return response
+
+def invalidate_user_public_key(user_id: str):
+    """Forget a user's cached public key (or cached absence of one)."""
+    _public_key_cache.pop(user_id)
+
+def _cache_public_key(user_id: str, public_key: Optional[str]):
+    # Users without a key are remembered briefly, so they can still register one soon after
+    expires_at = None if public_key else time.time() + PUBLIC_KEY_NEGATIVE_TTL_SECONDS
+    _public_key_cache.set(user_id, public_key, expires_at=expires_at)
 
 async def get_user_public_key(user_id: str):
-    """Retrieve a user's public key from the database."""
-    response = supabase.table("user_keys").select("public_key").eq("user_id", user_id).execute()
-    return response.data[0]["public_key"] if response.data else None
+    """Retrieve a user's current public key, from the in-process cache when possible."""
+    public_key = _public_key_cache.get(user_id)
+    if public_key is not MISSING:
+        return public_key
+    
+    response = await _execute("user_keys.select", lambda db: db.table("user_keys").select("public_key").eq("user_id", user_id).order("created_at", desc=True).limit(1).execute())
+    public_key = response.data[0]["public_key"] if response.data else None
+    _cache_public_key(user_id, public_key)
+    return public_key
+
+def public_key_cache_stats():
+    """Hit/miss counters of the public key cache."""
+    return _public_key_cache.stats()
+
+async def get_user_public_keys(user_ids: List[str]) -> Dict[str, Optional[str]]:
+    """Retrieve many users' current public keys; cache misses are fetched in one query.
+
+    Users without a key map to None.
+    """
+    public_keys, missing = {}, []
+    for user_id in dict.fromkeys(user_ids):
+        public_key = _public_key_cache.get(user_id)
+        if public_key is MISSING:
+            missing.append(user_id)
+        else:
+            public_keys[user_id] = public_key
+    
+    if missing:
+        response = await _execute("user_keys.select", lambda db: db.table("user_keys").select("user_id,public_key").in_("user_id", missing).order("created_at", desc=True).execute())
+        latest = {}
+        for row in response.data:
+            # Rows are newest first, so the first row per user is their current key
+            latest.setdefault(row["user_id"], row["public_key"])
+        for user_id in missing:
+            public_keys[user_id] = latest.get(user_id)
+            _cache_public_key(user_id, public_keys[user_id])
+    
+    return public_keys
+
+class SupabaseStorageBackend(StorageBackend):
+    """Supabase Storage through the shared async client."""
+
+    async def upload(self, bucket_name: str, file_path: str, content: bytes, content_type: Optional[str] = None,
+                     upsert: bool = False):
+        return await _execute("storage.upload", lambda db: db.storage.from_(bucket_name).upload(
+            file_path, content, _file_options(content_type, upsert)), SUPABASE_STORAGE_TIMEOUT_SECONDS)
 
-async def upload_file(bucket_name: str, file_path: str, file_content, content_type: str = None):
-    """Upload a file to Supabase Storage."""
-    return supabase.storage.from_(bucket_name).upload(file_path, file_content, content_type)
+    async def upload_from_path(self, bucket_name: str, file_path: str, source_path: str,
+                               content_type: Optional[str] = None):
+        return await _execute("storage.upload_stream", lambda db: db.storage.from_(bucket_name).upload(
+            file_path, source_path, _file_options(content_type)), STREAM_TIMEOUT_SECONDS)
+
+    async def download(self, bucket_name: str, file_path: str) -> bytes:
+        return await _execute("storage.download", lambda db: db.storage.from_(bucket_name).download(file_path),
+                              SUPABASE_STORAGE_TIMEOUT_SECONDS)
+
+    async def download_to_path(self, bucket_name: str, file_path: str, destination_path: str):
+        signed = await _execute("storage.create_signed_url", lambda db: db.storage.from_(bucket_name).create_signed_url(
+            file_path, SIGNED_URL_TTL_SECONDS))
+        started = time.perf_counter()
+        try:
+            async with _get_http_client().stream("GET", signed.get("signedURL") or signed["signedUrl"]) as response:
+                response.raise_for_status()
+                with open(destination_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                        f.write(chunk)
+        finally:
+            get_histogram("supabase.storage.download_stream").observe(time.perf_counter() - started)
+
+    async def exists(self, bucket_name: str, file_path: str) -> bool:
+        folder, _, name = file_path.rpartition("/")
+        entries = await _execute("storage.list", lambda db: db.storage.from_(bucket_name).list(
+            folder, {"search": name, "limit": 100}))
+        # search is a prefix match, so compare names exactly
+        return any(entry.get("name") == name for entry in entries or [])
+
+    async def remove(self, bucket_name: str, file_paths: List[str]):
+        return await _execute("storage.remove", lambda db: db.storage.from_(bucket_name).remove(file_paths))
+
+    async def public_url(self, bucket_name: str, file_path: str) -> str:
+        # Built locally from the project URL, no round trip (a coroutine in some storage3 releases)
+        url = (await get_client()).storage.from_(bucket_name).get_public_url(file_path)
+        return await url if inspect.isawaitable(url) else url
+
+STORAGE_BACKENDS = {
+    "supabase": SupabaseStorageBackend,
+    "local": LocalStorageBackend,
+}
+
+def _create_storage_backend() -> StorageBackend:
+    try:
+        return STORAGE_BACKENDS[STORAGE_BACKEND]()
+    except KeyError:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND} (expected one of {', '.join(STORAGE_BACKENDS)})")
+
+storage_backend: StorageBackend = _create_storage_backend()
+
+async def upload_file(bucket_name: str, file_path: str, file_content, content_type: str = None, upsert: bool = False):
+    """Upload a file to storage; with upsert an existing file at the path is overwritten."""
+    await document_cache.invalidate(bucket_name, file_path)
+    content = file_content if isinstance(file_content, bytes) else bytes(file_content)
+    return await storage_backend.upload(bucket_name, file_path, content, content_type, upsert)
 
 async def download_file(bucket_name: str, file_path: str):
-    """Download a file from Supabase Storage."""
-    return supabase.storage.from_(bucket_name).download(file_path)
+    """Download a file from storage, served from the local document cache when possible."""
+    if not storage_backend.cacheable:
+        return await storage_backend.download(bucket_name, file_path)
+    return await document_cache.read_through(
+        bucket_name, file_path, lambda: storage_backend.download(bucket_name, file_path))
+
+async def download_file_to_path(bucket_name: str, file_path: str, destination_path: str):
+    """Stream a file from storage to disk without holding it in memory."""
+    await storage_backend.download_to_path(bucket_name, file_path, destination_path)
+
+async def upload_file_from_path(bucket_name: str, file_path: str, source_path: str, content_type: str = None):
+    """Upload a file to storage, streaming it from disk."""
+    await document_cache.invalidate(bucket_name, file_path)
+    return await storage_backend.upload_from_path(bucket_name, file_path, source_path, content_type)
+
+async def remove_files(bucket_name: str, file_paths: List[str]):
+    """Remove files from storage and drop them from the local document cache."""
+    for file_path in file_paths:
+        await document_cache.invalidate(bucket_name, file_path)
+    return await storage_backend.remove(bucket_name, file_paths)
 
 async def get_file_url(bucket_name: str, file_path: str):
-    """Get a public URL for a file in Supabase Storage."""
-    return supabase.storage.from_(bucket_name).get_public_url(file_path)
+    """Get a public URL for a file in storage."""
+    return await storage_backend.public_url(bucket_name, file_path)
+
+async def _fetch_keyset_page(table: str, user_id: str, columns: List[str], limit: int,
+                             cursor: Optional[Tuple[str, str]], filters: List[Tuple[str, str, Any]]):
+    """Fetch up to limit + 1 of a user's rows, newest first, starting after cursor (created_at, id).
+
+    Served by the (user_id, created_at DESC, id DESC) index, so the cost of a
+    page does not depend on how many rows the user has.
+    """
+    def select(db: AsyncClient):
+        query = db.table(table).select(",".join(columns)).eq("user_id", user_id)
+        for method, column, value in filters:
+            query = getattr(query, method)(column, value)
+        if cursor:
+            created_at, row_id = cursor
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})')
+        return query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
 
-async def fetch_user_documents(user_id: str):
-    """Fetch documents metadata for a specific user."""
-    return supabase.table("documents").select("*").eq("user_id", user_id).execute()
+    response = await _execute(f"{table}.select_page", select)
+    return response.data
 
-async def save_document_metadata(user_id: str, file_url: str, file_name: str, file_type: str):
-    """Save document metadata to the database."""
-    return supabase.table("documents").insert({
+async def fetch_user_documents(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[Tuple[str, str]] = None,
+                               columns: Optional[List[str]] = None, file_type: Optional[str] = None,
+                               is_signed: Optional[bool] = None, created_after: Optional[str] = None,
+                               created_before: Optional[str] = None):
+    """Fetch one page of a user's document metadata, newest first (limit + 1 rows, to detect more)."""
+    filters = []
+    if file_type is not None:
+        filters.append(("eq", "file_type", file_type))
+    if is_signed is not None:
+        filters.append(("eq", "is_signed", is_signed))
+    if created_after is not None:
+        filters.append(("gte", "created_at", created_after))
+    if created_before is not None:
+        filters.append(("lt", "created_at", created_before))
+    return await _fetch_keyset_page("documents", user_id, columns or list(DOCUMENT_LIST_COLUMNS), limit, cursor, filters)
+
+async def save_document_metadata(user_id: str, file_url: str, file_name: str, file_type: str,
+                                 content_digest: Optional[str] = None, storage_path: Optional[str] = None,
+                                 file_size: Optional[int] = None, original_digest: Optional[str] = None,
+                                 original_size: Optional[int] = None, fingerprint: Optional[Dict[str, Any]] = None):
+    """Save document metadata to the database.
+
+    original_digest/original_size describe the bytes as uploaded when they
+    were optimized before storage; content_digest is always the stored bytes.
+    fingerprint holds the upload-time facts about a PDF (page count, sizes,
+    text layer, encryption) so later requests need not reopen the file.
+    """
+    metadata = {
         "user_id": user_id,
         "file_url": file_url,
         "file_name": file_name,
         "file_type": file_type
-    }).execute()
+    }
+    if content_digest is not None:
+        metadata["content_digest"] = content_digest
+        metadata["storage_path"] = storage_path
+        metadata["file_size"] = file_size
+    if original_digest is not None:
+        metadata["original_digest"] = original_digest
+        metadata["original_size"] = original_size
+    if fingerprint is not None:
+        metadata["fingerprint"] = fingerprint
+    response = await _execute("documents.insert", lambda db: db.table("documents").insert(metadata).execute())
+    invalidate_user_profile(user_id)
+    return response
+
+async def get_document_record(document_id: str, user_id: str):
+    """Fetch a single document row owned by the user, or None."""
+    response = await _execute("documents.select", lambda db: db.table("documents").select("*").eq("id", document_id).eq("user_id", user_id).execute())
+    return response.data[0] if response.data else None
+
+async def get_document_records(document_ids: List[str], user_id: str):
+    """Fetch many document rows owned by the user in one query."""
+    response = await _execute("documents.select", lambda db: db.table("documents").select("*").in_("id", document_ids).eq("user_id", user_id).execute())
+    return response.data
+
+def resolve_document_path(document: Dict[str, Any]) -> str:
+    """Return the storage path of a document row (content-addressed or legacy)."""
+    if document.get("storage_path"):
+        return document["storage_path"]
+    file_path = document.get("file_url", "").split("/")[-1]
+    return f"documents/{document['user_id']}/{file_path}"
+
+def content_object_path(content_digest: str) -> str:
+    """Fresh storage path for a content-addressed object, fanned out by digest prefix.
+
+    Each generation of an object gets its own path, so re-uploading content
+    whose previous object is still being removed never writes where the
+    removal is about to delete.
+    """
+    return f"{CONTENT_OBJECT_PREFIX}/{content_digest[:2]}/{content_digest}-{uuid.uuid4().hex[:12]}"
+
+async def store_document_content(content_digest: str, file_content, content_type: str = None):
+    """Store document bytes under their SHA3-256 digest, deduplicating identical uploads.
+
+    The reference is taken first, so the object cannot be removed while this
+    upload is in progress. A later reference skips the write only once the
+    object is confirmed to exist: the first uploader may still be writing it,
+    or may have failed. Writes are upserts, so racing uploaders of the same
+    bytes do not conflict. The row decides the storage path: an existing
+    object keeps its own, and a row waiting for its object to be removed is
+    revived under the fresh path passed in.
+    """
+    response = await _execute("rpc.acquire_document_object", lambda db: db.rpc("acquire_document_object", {
+        "p_digest": content_digest,
+        "p_storage_path": content_object_path(content_digest),
+        "p_size": len(file_content)
+    }).execute())
+    ref_count, storage_path = response.data[0]["ref_count"], response.data[0]["storage_path"]
+    
+    try:
+        if ref_count <= 1 or not await storage_backend.exists(DOCUMENTS_BUCKET, storage_path):
+            await upload_file(DOCUMENTS_BUCKET, storage_path, file_content, content_type, upsert=True)
+    except Exception:
+        await release_document_content(content_digest)
+        raise
+    
+    return {
+        "content_digest": content_digest,
+        "storage_path": storage_path,
+        "file_size": len(file_content)
+    }
+
+async def _remove_unreferenced_objects(objects: List[Tuple[str, str]]) -> List[str]:
+    """Remove (digest, storage_path) objects left at zero references, then their rows.
+
+    Rows stay at zero references until their object is gone, and are only
+    deleted if they still point at the removed path: one revived by a new
+    upload in between has moved to a fresh path and is left alone. If the
+    storage remove fails the rows are kept, so the objects can be found again
+    by a sweep over document_objects rows with ref_count = 0.
+    Returns the digests whose objects were removed.
+    """
+    try:
+        await remove_files(DOCUMENTS_BUCKET, [storage_path for _, storage_path in objects])
+    except Exception as e:
+        print(f"Error deleting content objects: {str(e)}")
+        return []
+    await _execute("rpc.delete_document_objects", lambda db: db.rpc("delete_document_objects", {
+        "p_digests": [digest for digest, _ in objects],
+        "p_storage_paths": [storage_path for _, storage_path in objects]
+    }).execute())
+    return [digest for digest, _ in objects]
+
+async def release_document_content(content_digest: str):
+    """Drop one reference to a content-addressed object, removing it when unreferenced."""
+    response = await _execute("rpc.release_document_object", lambda db: db.rpc("release_document_object", {"p_digest": content_digest}).execute())
+    if not response.data:
+        return 0
+    remaining = response.data[0]["remaining"]
+    
+    if remaining == 0:
+        await _remove_unreferenced_objects([(content_digest, response.data[0]["storage_path"])])
+    return remaining
+
+async def release_document_contents(content_digests: List[str]):
+    """Drop one reference per listed digest (repeats drop several) in one call.
+
+    Objects left unreferenced are removed from storage in one batched call.
+    Returns the digests whose objects were removed.
+    """
+    counts = Counter(content_digests)
+    response = await _execute("rpc.release_document_objects", lambda db: db.rpc("release_document_objects", {
+        "p_digests": list(counts),
+        "p_counts": list(counts.values())
+    }).execute())
+    
+    unreferenced = [(row["digest"], row["storage_path"]) for row in response.data or [] if row["remaining"] == 0]
+    if not unreferenced:
+        return []
+    return await _remove_unreferenced_objects(unreferenced)
+
+async def delete_documents(document_ids: List[str], user_id: str):
+    """Delete many of a user's documents with one select, one storage remove and one delete.
+
+    Returns a per-id outcome: "deleted" or "not_found" (missing or owned by someone else).
+    """
+    response = await _execute("documents.select", lambda db: db.table("documents").select("id,file_url,content_digest").in_("id", document_ids).eq("user_id", user_id).execute())
+    documents = {document["id"]: document for document in response.data}
+    
+    # Legacy per-user files are owned by their row, so remove them outright
+    legacy_paths = [
+        f"documents/{user_id}/{document['file_url'].split('/')[-1]}"
+        for document in documents.values()
+        if document.get("file_url") and not document.get("content_digest")
+    ]
+    if legacy_paths:
+        try:
+            await remove_files("documents", legacy_paths)
+        except Exception as e:
+            # Log the error but continue with DB deletion
+            print(f"Error deleting files: {str(e)}")
+    
+    deleted_ids = set()
+    if documents:
+        delete_response = await _execute("documents.delete", lambda db: db.table("documents").delete().in_("id", list(documents)).eq("user_id", user_id).execute())
+        deleted_ids = {row["id"] for row in delete_response.data}
+    
+    # Content-addressed objects are shared between rows, so drop references for every deleted row at once
+    digests = [documents[document_id]["content_digest"] for document_id in deleted_ids if documents[document_id].get("content_digest")]
+    if digests:
+        try:
+            await release_document_contents(digests)
+        except Exception as e:
+            print(f"Error releasing content objects: {str(e)}")
+    
+    if deleted_ids:
+        invalidate_user_profile(user_id)
+    return {document_id: "deleted" if document_id in deleted_ids else "not_found" for document_id in document_ids}
 
 async def delete_document(document_id: str, user_id: str):
     """Delete a document from the database and storage."""
     # First get the document to retrieve the file path
-    response = supabase.table("documents").select("*").eq("id", document_id).eq("user_id", user_id).execute()
+    response = await _execute("documents.select", lambda db: db.table("documents").select("*").eq("id", document_id).eq("user_id", user_id).execute())
     
     if not response.data:
         return {"success": False, "message": "Document not found or access denied"}
@@ -73,29 +508,62 @@ async def delete_document(document_id: str, user_id: str):
     document = response.data[0]
     file_url = document.get("file_url")
     
-    # Extract file path from URL
-    if file_url:
+    if file_url and not document.get("content_digest"):
+        # Extract file path from URL
         file_path = file_url.split("/")[-1]
         # Delete from storage
         try:
-            supabase.storage.from_("documents").remove([f"documents/{user_id}/{file_path}"])
+            await remove_files("documents", [f"documents/{user_id}/{file_path}"])
         except Exception as e:
             # Log the error but continue with DB deletion
             print(f"Error deleting file: {str(e)}")
     
     # Delete from database
-    delete_response = supabase.table("documents").delete().eq("id", document_id).eq("user_id", user_id).execute()
+    delete_response = await _execute("documents.delete", lambda db: db.table("documents").delete().eq("id", document_id).eq("user_id", user_id).execute())
     
+    # Content-addressed objects are shared between rows, so drop a reference instead
+    if document.get("content_digest"):
+        try:
+            await release_document_content(document["content_digest"])
+        except Exception as e:
+            print(f"Error releasing content object: {str(e)}")
+    
+    invalidate_user_profile(user_id)
     return {"success": True, "deleted": delete_response.data}
 
-async def fetch_user_signatures(user_id: str):
-    """Fetch all saved signatures for a specific user."""
-    return supabase.table("signatures").select("*").eq("user_id", user_id).execute()
+async def save_signature_metadata(user_id: str, signature_url: str, rendition_path: Optional[str] = None):
+    """Save a signature style row, with the path of its pre-rendered PNG."""
+    return await _execute("signatures.insert", lambda db: db.table("signatures").insert({
+        "user_id": user_id,
+        "signature_url": signature_url,
+        "rendition_path": rendition_path
+    }).execute())
+
+async def get_signature_record(user_id: str, signature_id: Optional[str] = None):
+    """Fetch a signature row owned by the user; the most recent one if no id is given."""
+    def select(db: AsyncClient):
+        query = db.table("signatures").select("*").eq("user_id", user_id)
+        if signature_id:
+            return query.eq("id", signature_id).execute()
+        return query.order("created_at", desc=True).limit(1).execute()
+    response = await _execute("signatures.select", select)
+    return response.data[0] if response.data else None
+
+async def fetch_user_signatures(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[Tuple[str, str]] = None,
+                                columns: Optional[List[str]] = None, created_after: Optional[str] = None,
+                                created_before: Optional[str] = None):
+    """Fetch one page of a user's saved signatures, newest first (limit + 1 rows, to detect more)."""
+    filters = []
+    if created_after is not None:
+        filters.append(("gte", "created_at", created_after))
+    if created_before is not None:
+        filters.append(("lt", "created_at", created_before))
+    return await _fetch_keyset_page("signatures", user_id, columns or list(SIGNATURE_LIST_COLUMNS), limit, cursor, filters)
 
 async def delete_signature(signature_id: str, user_id: str):
     """Delete a signature from the database and storage."""
     # First get the signature to retrieve the file path
-    response = supabase.table("signatures").select("*").eq("id", signature_id).eq("user_id", user_id).execute()
+    response = await _execute("signatures.select", lambda db: db.table("signatures").select("*").eq("id", signature_id).eq("user_id", user_id).execute())
     
     if not response.data:
         return {"success": False, "message": "Signature not found or access denied"}
@@ -108,58 +576,89 @@ async def delete_signature(signature_id: str, user_id: str):
         file_path = signature_url.split("/")[-1]
         # Delete from storage
         try:
-            supabase.storage.from_("signatures").remove([f"signatures/{user_id}/{file_path}"])
+            paths = [f"signatures/{user_id}/{file_path}"]
+            if signature.get("rendition_path"):
+                paths.append(signature["rendition_path"])
+            await remove_files("signatures", paths)
         except Exception as e:
             # Log the error but continue with DB deletion
             print(f"Error deleting file: {str(e)}")
     
     # Delete from database
-    delete_response = supabase.table("signatures").delete().eq("id", signature_id).eq("user_id", user_id).execute()
+    delete_response = await _execute("signatures.delete", lambda db: db.table("signatures").delete().eq("id", signature_id).eq("user_id", user_id).execute())
     
-    return {"success": True, "deleted": delete_response.data}
+    return {"success": True, "deleted": delete_response.data, "rendition_path": signature.get("rendition_path")}
 
-async def get_user_profile(user_id: str) -> Dict[str, Any]:
-    """Get user profile information."""
-    # Get user info
-    user_response = supabase.table("profiles").select("*").eq("id", user_id).execute()
+async def delete_signatures(signature_ids: List[str], user_id: str):
+    """Delete many of a user's signatures with one select, one storage remove and one delete.
+
+    Returns (per-id outcome, rendition paths of the deleted signatures).
+    """
+    response = await _execute("signatures.select", lambda db: db.table("signatures").select("id,signature_url,rendition_path").in_("id", signature_ids).eq("user_id", user_id).execute())
+    signatures = {signature["id"]: signature for signature in response.data}
+    
+    paths = []
+    for signature in signatures.values():
+        if signature.get("signature_url"):
+            paths.append(f"signatures/{user_id}/{signature['signature_url'].split('/')[-1]}")
+        if signature.get("rendition_path"):
+            paths.append(signature["rendition_path"])
+    if paths:
+        try:
+            await remove_files("signatures", paths)
+        except Exception as e:
+            # Log the error but continue with DB deletion
+            print(f"Error deleting files: {str(e)}")
+    
+    deleted_ids = set()
+    if signatures:
+        delete_response = await _execute("signatures.delete", lambda db: db.table("signatures").delete().in_("id", list(signatures)).eq("user_id", user_id).execute())
+        deleted_ids = {row["id"] for row in delete_response.data}
+    
+    outcomes = {signature_id: "deleted" if signature_id in deleted_ids else "not_found" for signature_id in signature_ids}
+    rendition_paths = [signatures[signature_id]["rendition_path"] for signature_id in deleted_ids if signatures[signature_id].get("rendition_path")]
+    return outcomes, rendition_paths
+
+def invalidate_user_profile(user_id: str):
+    """Drop a user's cached profile after their documents, plan or profile changed."""
+    _profile_cache.pop(user_id)
+
+async def _count_user_documents(user_id: str) -> int:
+    response = await _execute("documents.count", lambda db: db.table("documents").select("id", count="exact").eq("user_id", user_id).execute())
+    return response.count if hasattr(response, 'count') and response.count is not None else 0
+
+async def _load_user_profile(user_id: str) -> Dict[str, Any]:
+    # The profile and latest subscription are independent, so fetch them together
+    user_response, subscription_response = await asyncio.gather(
+        _execute("profiles.select", lambda db: db.table("profiles").select("*").eq("id", user_id).execute()),
+        _execute("subscriptions.select", lambda db: db.table("subscriptions").select("plan_name").eq("user_id", user_id).order("created_at", desc=True).limit(1).execute())
+    )
     
-    # If user doesn't exist in profiles table, return basic info
+    # If user doesn't exist in profiles table, return basic info; they may already own documents
     if not user_response.data:
-        user_auth = supabase.auth.admin.get_user(user_id)
+        user_auth, document_count = await asyncio.gather(
+            _execute("auth.get_user", lambda db: db.auth.admin.get_user(user_id)),
+            _count_user_documents(user_id)
+        )
         return {
             "email": user_auth.user.email,
             "full_name": None,
             "organization": None,
-            "current_plan": "Free",
+            "current_plan": FREE_PLAN_NAME,
             "document_usage": {
-                "used": 0,
-                "limit": 3  # Free tier limit
+                "used": document_count,
+                "limit": FREE_PLAN_DOCUMENT_LIMIT
             }
         }
     
     user_data = user_response.data[0]
     
-    # Get document count
-    doc_count_response = supabase.table("documents").select("id", count="exact").eq("user_id", user_id).execute()
-    document_count = doc_count_response.count if hasattr(doc_count_response, 'count') else 0
-    
-    # Get plan info
-    subscription_response = supabase.table("subscriptions").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(1).execute()
-    
-    current_plan = "Free"
-    doc_limit = 3  # Default free tier
+    # profiles.document_count is seeded when the row is inserted and kept current by a trigger on documents
+    document_count = user_data["document_count"]
     
+    current_plan = FREE_PLAN_NAME
     if subscription_response.data:
-        subscription = subscription_response.data[0]
-        current_plan = subscription.get("plan_name", "Free")
-        
-        # Set document limit based on plan
-        if current_plan == "Creator Plan":
-            doc_limit = 10
-        elif current_plan == "Pro Plan":
-            doc_limit = 100
-        elif current_plan == "Premium Plan":
-            doc_limit = 250
+        current_plan = subscription_response.data[0].get("plan_name") or FREE_PLAN_NAME
     
     return {
         "email": user_data.get("email"),
@@ -168,10 +667,18 @@ async def get_user_profile(user_id: str) -> Dict[str, Any]:
         "current_plan": current_plan,
         "document_usage": {
             "used": document_count,
-            "limit": doc_limit
+            "limit": document_limit_for(current_plan)
         }
     }
 
+async def get_user_profile(user_id: str) -> Dict[str, Any]:
+    """Get user profile information, cached for PROFILE_CACHE_TTL_SECONDS."""
+    profile = _profile_cache.get(user_id)
+    if profile is MISSING:
+        profile = await _load_user_profile(user_id)
+        _profile_cache.set(user_id, profile)
+    return profile
+
 async def update_user_profile(user_id: str, full_name: Optional[str] = None, organization: Optional[str] = None) -> Dict[str, Any]:
     """Update user profile information."""
     # Prepare update data
@@ -187,17 +694,19 @@ async def update_user_profile(user_id: str, full_name: Optional[str] = None, org
         return {"success": False, "message": "No data to update"}
     
     # Check if profile exists
-    profile_check = supabase.table("profiles").select("id").eq("id", user_id).execute()
+    profile_check = await _execute("profiles.select", lambda db: db.table("profiles").select("id").eq("id", user_id).execute())
     
     if not profile_check.data:
         # Profile doesn't exist, create it
-        user_auth = supabase.auth.admin.get_user(user_id)
+        user_auth = await _execute("auth.get_user", lambda db: db.auth.admin.get_user(user_id))
         update_data["id"] = user_id
         update_data["email"] = user_auth.user.email
-        response = supabase.table("profiles").insert(update_data).execute()
+        response = await _execute("profiles.insert", lambda db: db.table("profiles").insert(update_data).execute())
     else:
         # Update existing profile
-        response = supabase.table("profiles").update(update_data).eq("id", user_id).execute()
+        response = await _execute("profiles.update", lambda db: db.table("profiles").update(update_data).eq("id", user_id).execute())
+    
+    invalidate_user_profile(user_id)
     
     return {
         "success": True,
@@ -0,0 +1,92 @@
+import asyncio
+import codecs
+import io
+import os
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from dotenv import load_dotenv
+from app.services.compute_executor import run_in_pool, get_pool
+from app.services.pdf_service import extract_pdf_text_range
+
+load_dotenv()
+
+# WordprocessingML namespace used by every element we read from document.xml
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCX_BODY_PART = "word/document.xml"
+TEXT_DECODE_CHUNK_SIZE = 1024 * 1024
+
+# PDFs with at least this many pages are extracted across several pdf workers
+PARALLEL_EXTRACTION_MIN_PAGES = int(os.getenv("PARALLEL_EXTRACTION_MIN_PAGES", 200))
+PARALLEL_EXTRACTION_WORKERS = int(os.getenv("PARALLEL_EXTRACTION_WORKERS", get_pool("pdf").max_workers))
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+def extract_txt_text(text_content: bytes) -> str:
+    """Decode a plain-text upload without parsing it.
+
+    Uses the byte-order mark when there is one and UTF-8 otherwise, decoding
+    in fixed-size slices so no intermediate copy of the whole file is made.
+    Undecodable bytes are replaced rather than failing the whole document.
+    """
+    encoding = "utf-8"
+    for bom, bom_encoding in _BOMS:
+        if text_content.startswith(bom):
+            encoding = bom_encoding
+            break
+
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    view = memoryview(text_content)
+    parts = [decoder.decode(view[start:start + TEXT_DECODE_CHUNK_SIZE])
+             for start in range(0, len(view), TEXT_DECODE_CHUNK_SIZE)]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+def extract_docx_text(docx_content: bytes) -> str:
+    """Extract the body text of a DOCX, one line per paragraph.
+
+    document.xml is decompressed and parsed as a stream; each paragraph is
+    cleared once its text is collected, so memory stays flat for long
+    documents and the rest of the archive (media, styles) is never read.
+    """
+    parts = []
+    with zipfile.ZipFile(io.BytesIO(docx_content)) as archive:
+        with archive.open(DOCX_BODY_PART) as body:
+            for _, element in ET.iterparse(body, events=("end",)):
+                tag = element.tag
+                if tag == WORD_NAMESPACE + "t":
+                    parts.append(element.text or "")
+                elif tag == WORD_NAMESPACE + "tab":
+                    parts.append("\t")
+                elif tag in (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"):
+                    parts.append("\n")
+                elif tag == WORD_NAMESPACE + "p":
+                    parts.append("\n")
+                    element.clear()
+    return "".join(parts)
+
+async def extract_pdf_text_parallel(pdf_content: bytes, page_count: int, workers: int = None) -> str:
+    """Extract a large PDF's text by splitting its pages across the pdf pool.
+
+    The document is written once to a temporary file that every worker opens
+    by path; each worker extracts a contiguous page range and the ranges are
+    joined back in page order.
+    """
+    workers = max(1, min(workers or PARALLEL_EXTRACTION_WORKERS, page_count))
+    pages_per_worker = -(-page_count // workers)  # ceiling division
+
+    fd, document_path = tempfile.mkstemp(prefix="signthatdoc-extract-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            await asyncio.to_thread(f.write, pdf_content)
+        parts = await asyncio.gather(*[
+            run_in_pool("pdf", extract_pdf_text_range, document_path, start, start + pages_per_worker)
+            for start in range(0, page_count, pages_per_worker)
+        ])
+    finally:
+        os.remove(document_path)
+    return "".join(parts)
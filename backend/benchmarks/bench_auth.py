@@ -0,0 +1,113 @@
+"""Per-request cost of authenticating a bearer token.
+
+decode_twice is the old path: the middleware and get_current_user each
+decoded and HMAC-checked the token. The verify_token cases are the new path,
+which checks a token once and serves repeats from the verified token cache.
+The middleware[...] cases time one pass through JWTMiddleware around an
+app that does nothing, i.e. the auth cost every request pays.
+
+Run from the backend directory:
+    python -m benchmarks.bench_auth --workers 1 --output auth.json
+"""
+import argparse
+import os
+import time
+import uuid
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+
+from jose import jwt
+
+from app.routers import auth
+from benchmarks.harness import print_results, run_case, write_results
+
+def make_token():
+    return jwt.encode(
+        {"sub": str(uuid.uuid4()), "exp": int(time.time()) + 3600, "role": "authenticated"},
+        auth.JWT_SECRET, algorithm=auth.JWT_ALGORITHM
+    )
+
+async def bench_decode_twice():
+    token = make_token()
+
+    async def operation():
+        jwt.decode(token, auth.JWT_SECRET, algorithms=[auth.JWT_ALGORITHM])
+        jwt.decode(token, auth.JWT_SECRET, algorithms=[auth.JWT_ALGORITHM])
+    return operation
+
+async def bench_verify_token_uncached():
+    # A fresh token every call, as for the first request of each session
+    tokens = [make_token() for _ in range(5000)]
+    index = 0
+
+    async def operation():
+        nonlocal index
+        auth.verify_token(tokens[index % len(tokens)])
+        index += 1
+        if index % len(tokens) == 0:
+            auth._verified_tokens.clear()
+    return operation
+
+async def bench_verify_token_cached():
+    token = make_token()
+    auth.verify_token(token)
+
+    async def operation():
+        auth.verify_token(token)
+    return operation
+
+async def _noop_app(scope, receive, send):
+    pass
+
+async def _noop_receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def _noop_send(message):
+    pass
+
+def bench_middleware(path, authorization=None):
+    async def build():
+        middleware = auth.JWTMiddleware(_noop_app)
+        headers = [(b"host", b"localhost"), (b"accept", b"*/*")]
+        if authorization is not None:
+            headers.append((b"authorization", authorization()))
+
+        async def operation():
+            scope = {"type": "http", "method": "GET", "path": path, "headers": headers}
+            await middleware(scope, _noop_receive, _noop_send)
+        return operation
+    return build
+
+CASES = {
+    "decode_twice": bench_decode_twice,
+    "verify_token[uncached]": bench_verify_token_uncached,
+    "verify_token[cached]": bench_verify_token_cached,
+    "middleware[public path]": bench_middleware("/auth/login"),
+    "middleware[authenticated]": bench_middleware("/documents/list", lambda: f"Bearer {make_token()}".encode()),
+    "middleware[missing token]": bench_middleware("/documents/list"),
+    "middleware[invalid token]": bench_middleware("/documents/list", lambda: b"Bearer not.a.token"),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="Process counts to run each case with")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--min-time", type=float, default=2.0, help="Seconds to run each case for")
+    parser.add_argument("--max-iterations", type=int, default=20000)
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for case in args.cases:
+        for workers in args.workers:
+            results.append(run_case("benchmarks.bench_auth", case, workers,
+                                    args.min_time, args.max_iterations))
+
+    print_results(results, args.baseline)
+    if args.output:
+        write_results(args.output, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Micro-benchmarks for every operation in crypto_service.
+
+Reports ops/sec and p50/p99 latency single-process and across worker processes.
+The plain case names time the synchronous implementation and are comparable
+with runs from before crypto moved onto the compute pools; the [pool] cases
+time the same operation through the crypto pool, executor hop included.
+Run from the backend directory:
+    python -m benchmarks.bench_crypto --workers 1 4 --output crypto.json
+    python -m benchmarks.bench_crypto --baseline crypto.json   # compare with an earlier run
+"""
+import argparse
+import functools
+import json
+import os
+import uuid
+
+from app.services import crypto_service
+from benchmarks.harness import run_case, print_results, write_results, use_ephemeral_server_kem_keypair
+
+HASH_SIZES = {
+    "10KB": 10 * 1024,
+    "100KB": 100 * 1024,
+    "1MB": 1024 * 1024,
+    "10MB": 10 * 1024 * 1024,
+    "50MB": 50 * 1024 * 1024,
+}
+MERKLE_PAGE_COUNTS = (10, 100, 1000)
+
+def _implementation(fn, pooled):
+    """The offloaded coroutine itself, or its synchronous implementation wrapped as one."""
+    if pooled:
+        return fn
+    blocking = fn.blocking
+
+    async def call(*args, **kwargs):
+        return blocking(*args, **kwargs)
+    return call
+
+def bench_generate_dilithium_keypair(pooled):
+    async def build():
+        return _implementation(crypto_service.generate_dilithium_keypair, pooled)
+    return build
+
+def bench_generate_kyber_keypair(pooled):
+    async def build():
+        return _implementation(crypto_service.generate_kyber_keypair, pooled)
+    return build
+
+def bench_sign_document_hash(pooled):
+    async def build():
+        private_key, _ = await crypto_service.generate_dilithium_keypair()
+        document_hash = await crypto_service.hash_document(os.urandom(1024))
+        sign_document_hash = _implementation(crypto_service.sign_document_hash, pooled)
+
+        async def operation():
+            await sign_document_hash(document_hash, private_key)
+        return operation
+    return build
+
+def bench_verify_signature(pooled):
+    async def build():
+        private_key, public_key = await crypto_service.generate_dilithium_keypair()
+        document_hash = await crypto_service.hash_document(os.urandom(1024))
+        signature = await crypto_service.sign_document_hash(document_hash, private_key)
+        verify_signature = _implementation(crypto_service.verify_signature, pooled)
+
+        async def operation():
+            assert await verify_signature(document_hash, signature, public_key)
+        return operation
+    return build
+
+def bench_hash_document(size, pooled):
+    async def build():
+        content = os.urandom(size)
+        hash_document = _implementation(crypto_service.hash_document, pooled)
+
+        async def operation():
+            await hash_document(content)
+        return operation
+    return build
+
+def _session_payload():
+    return json.dumps({
+        "session_id": str(uuid.uuid4()),
+        "document_id": str(uuid.uuid4()),
+        "created_by": str(uuid.uuid4()),
+        "expires_at": "2030-01-01T00:00:00",
+    }, separators=(",", ":"))
+
+def bench_encrypt_session_data(pooled):
+    async def build():
+        use_ephemeral_server_kem_keypair()
+        crypto_service.get_server_kem_keypair()
+        payload = _session_payload()
+        encrypt_session_data = _implementation(crypto_service.encrypt_session_data, pooled)
+
+        async def operation():
+            await encrypt_session_data(payload)
+        return operation
+    return build
+
+def bench_decrypt_session_data(pooled):
+    async def build():
+        use_ephemeral_server_kem_keypair()
+        crypto_service.get_server_kem_keypair()
+        token = await crypto_service.encrypt_session_data(_session_payload())
+        decrypt_session_data = _implementation(crypto_service.decrypt_session_data, pooled)
+
+        async def operation():
+            await decrypt_session_data(token)
+        return operation
+    return build
+
+def bench_merkle_root(page_count):
+    async def build():
+        leaves = [crypto_service.hash_merkle_leaf(os.urandom(64)) for _ in range(page_count)]
+
+        async def operation():
+            crypto_service.merkle_root(leaves)
+        return operation
+    return build
+
+POOLED_CASES = {
+    "generate_dilithium_keypair": bench_generate_dilithium_keypair,
+    "generate_kyber_keypair": bench_generate_kyber_keypair,
+    "sign_document_hash": bench_sign_document_hash,
+    "verify_signature": bench_verify_signature,
+    **{f"hash_document[{label}]": functools.partial(bench_hash_document, size) for label, size in HASH_SIZES.items()},
+    "encrypt_session_data": bench_encrypt_session_data,
+    "decrypt_session_data": bench_decrypt_session_data,
+}
+
+CASES = {
+    **{name: bench(pooled=False) for name, bench in POOLED_CASES.items()},
+    **{f"{name}[pool]": bench(pooled=True) for name, bench in POOLED_CASES.items()},
+    **{f"merkle_root[{count} pages]": bench_merkle_root(count) for count in MERKLE_PAGE_COUNTS},
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="Process counts to run each case with")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--min-time", type=float, default=2.0, help="Seconds to run each case for")
+    parser.add_argument("--max-iterations", type=int, default=2000)
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for case in args.cases:
+        for workers in args.workers:
+            results.append(run_case("benchmarks.bench_crypto", case, workers,
+                                    args.min_time, args.max_iterations))
+
+    print_results(results, args.baseline)
+    if args.output:
+        write_results(args.output, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark sequential vs parallel PDF text extraction.
+
+Builds synthetic text-heavy PDFs and times extract_pdf_text in one pdf worker
+against extract_pdf_text_parallel split across several. Run from the backend
+directory:
+    python -m benchmarks.bench_extraction --output extraction.json
+    python -m benchmarks.bench_extraction --cases "parallel[1000 pages, 4 workers]"
+"""
+import argparse
+import os
+
+import fitz  # PyMuPDF
+
+from app.services.compute_executor import run_in_pool, get_pool
+from app.services.pdf_service import extract_pdf_text
+from app.services.text_extraction import extract_pdf_text_parallel
+from benchmarks.harness import run_case, print_results, write_results
+
+PAGE_COUNTS = (200, 1000)
+# Parallel cases can use at most the pdf pool (COMPUTE_PDF_WORKERS, default cpu count)
+WORKER_COUNTS = sorted({min(count, get_pool("pdf").max_workers) for count in (2, 4, os.cpu_count() or 1)})
+LINES_PER_PAGE = 50
+
+def build_pdf(page_count):
+    """A PDF whose pages are full of text, roughly like a contract bundle."""
+    document = fitz.open()
+    line = "The Parties agree that this Agreement shall be governed by the laws of the State. "
+    for page_number in range(page_count):
+        page = document.new_page()
+        page.insert_text((36, 48), f"Page {page_number + 1}\n" + (line + "\n") * LINES_PER_PAGE, fontsize=9)
+    content = document.tobytes(deflate=True)
+    document.close()
+    return content
+
+def bench_sequential(page_count):
+    async def build():
+        content = build_pdf(page_count)
+
+        async def operation():
+            await run_in_pool("pdf", extract_pdf_text, content)
+        return operation
+    return build
+
+def bench_parallel(page_count, workers):
+    async def build():
+        content = build_pdf(page_count)
+
+        async def operation():
+            await extract_pdf_text_parallel(content, page_count, workers)
+        return operation
+    return build
+
+CASES = {
+    **{f"sequential[{count} pages]": bench_sequential(count) for count in PAGE_COUNTS},
+    **{f"parallel[{count} pages, {workers} workers]": bench_parallel(count, workers)
+       for count in PAGE_COUNTS for workers in WORKER_COUNTS},
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--min-time", type=float, default=5.0, help="Seconds to run each case for")
+    parser.add_argument("--max-iterations", type=int, default=50)
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = [
+        run_case("benchmarks.bench_extraction", case, 1, args.min_time, args.max_iterations)
+        for case in args.cases
+    ]
+
+    print_results(results, args.baseline)
+    if args.output:
+        write_results(args.output, results)
+
+if __name__ == "__main__":
+    main()
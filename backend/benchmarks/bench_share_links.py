@@ -0,0 +1,48 @@
+"""Throughput of guest share-link generation and validation.
+
+Run from the backend directory:
+    python -m benchmarks.bench_share_links --iterations 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.services.crypto_service import encrypt_session_data, decrypt_session_data, get_server_kem_keypair
+from benchmarks.harness import use_ephemeral_server_kem_keypair
+
+def make_session_data():
+    return json.dumps({
+        "session_id": str(uuid.uuid4()),
+        "document_id": str(uuid.uuid4()),
+        "created_by": str(uuid.uuid4()),
+        "expires_at": (datetime.utcnow() + timedelta(hours=24)).isoformat()
+    }, separators=(",", ":"))
+
+async def run(iterations: int):
+    # Load the server keypair outside the timed section, as the app does once per process
+    use_ephemeral_server_kem_keypair()
+    get_server_kem_keypair()
+    payloads = [make_session_data() for _ in range(iterations)]
+
+    start = time.perf_counter()
+    tokens = [await encrypt_session_data(payload) for payload in payloads]
+    generate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for token in tokens:
+        await decrypt_session_data(token)
+    validate_seconds = time.perf_counter() - start
+
+    print(f"iterations:        {iterations}")
+    print(f"token length:      {len(tokens[0])} chars")
+    print(f"generate links/s:  {iterations / generate_seconds:,.0f}")
+    print(f"validate links/s:  {iterations / validate_seconds:,.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
@@ -0,0 +1,130 @@
+"""Shared timing harness for the backend benchmarks.
+
+A benchmark module exposes CASES, a dict of case name -> builder. A builder does
+any setup and returns an async callable with no arguments; that callable is one
+operation. Builders run inside each worker process, so cases never have to be
+pickled.
+"""
+import asyncio
+import base64
+import importlib
+import json
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+def use_ephemeral_server_kem_keypair():
+    """Give benchmarks a throwaway server Kyber keypair when none is configured.
+
+    Links only have to validate within the run, so any keypair will do.
+    """
+    if os.getenv("KYBER_SERVER_PUBLIC_KEY") and os.getenv("KYBER_SERVER_PRIVATE_KEY"):
+        return
+    from oqs import KeyEncapsulation
+    from app.services.crypto_service import KYBER_ALG
+
+    with KeyEncapsulation(KYBER_ALG) as kem:
+        public_key = kem.generate_keypair()
+        os.environ["KYBER_SERVER_PUBLIC_KEY"] = base64.b64encode(public_key).decode("utf-8")
+        os.environ["KYBER_SERVER_PRIVATE_KEY"] = base64.b64encode(kem.export_secret_key()).decode("utf-8")
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+async def _measure(operation, min_time, max_iterations, warmup):
+    for _ in range(warmup):
+        await operation()
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_iterations:
+        op_start = time.perf_counter()
+        await operation()
+        latencies.append(time.perf_counter() - op_start)
+        if time.perf_counter() - started >= min_time and len(latencies) >= 5:
+            break
+    return latencies, time.perf_counter() - started
+
+def _run_case(module_name, case_name, min_time, max_iterations, warmup):
+    """Build and time one case in the current process (also the worker entry point)."""
+    builder = importlib.import_module(module_name).CASES[case_name]
+
+    async def main():
+        operation = await builder()
+        return await _measure(operation, min_time, max_iterations, warmup)
+
+    return asyncio.run(main())
+
+def run_case(module_name, case_name, workers=1, min_time=2.0, max_iterations=1000, warmup=2):
+    """Time a case single-process or across N worker processes.
+
+    Returns:
+        dict: ops/sec (aggregate over workers) and latency percentiles in ms
+    """
+    if workers == 1:
+        runs = [_run_case(module_name, case_name, min_time, max_iterations, warmup)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_run_case, module_name, case_name, min_time, max_iterations, warmup)
+                for _ in range(workers)
+            ]
+            runs = [future.result() for future in futures]
+
+    latencies = sorted(latency for run_latencies, _ in runs for latency in run_latencies)
+    ops_per_sec = sum(len(run_latencies) / elapsed for run_latencies, elapsed in runs)
+
+    return {
+        "case": case_name,
+        "workers": workers,
+        "iterations": len(latencies),
+        "ops_per_sec": round(ops_per_sec, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+    }
+
+def environment_metadata():
+    """Describe the machine and revision so result files can be compared later."""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def print_results(results, baseline=None):
+    """Print a results table, with the change in ops/sec against a baseline file if given."""
+    previous = {}
+    if baseline:
+        with open(baseline) as f:
+            previous = {(r["case"], r["workers"]): r for r in json.load(f)["results"]}
+
+    print(f"{'case':<36} {'workers':>7} {'ops/sec':>12} {'p50 ms':>10} {'p99 ms':>10} {'vs base':>9}")
+    for result in results:
+        line = (f"{result['case']:<36} {result['workers']:>7} {result['ops_per_sec']:>12,.1f} "
+                f"{result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f}")
+        old = previous.get((result["case"], result["workers"]))
+        if old and old["ops_per_sec"]:
+            line += f" {(result['ops_per_sec'] / old['ops_per_sec'] - 1) * 100:>+8.1f}%"
+        print(line)
+
+def write_results(path, results):
+    """Write results plus environment metadata as JSON."""
+    with open(path, "w") as f:
+        json.dump({"metadata": environment_metadata(), "results": results}, f, indent=2)
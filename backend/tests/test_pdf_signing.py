@@ -0,0 +1,114 @@
+import io
+import json
+
+import fitz
+from PIL import Image, ImageDraw
+
+from app.services.pdf_service import MERKLE_MANIFEST_NAME, compute_merkle_tree, overlay_signature, verify_page_file
+
+def make_document(page_count=3):
+    document = fitz.open()
+    for page_index in range(page_count):
+        document.new_page().insert_text((72, 72), f"Page {page_index + 1}")
+    try:
+        return document.tobytes()
+    finally:
+        document.close()
+
+def make_signature():
+    # Black ink on a transparent background, which gets a 1-bit soft mask
+    image = Image.new("RGBA", (400, 200), (0, 0, 0, 0))
+    ImageDraw.Draw(image).line([(20, 150), (120, 40), (220, 160), (380, 30)], fill=(0, 0, 0, 255), width=8)
+    content = io.BytesIO()
+    image.save(content, format="PNG")
+    return content.getvalue()
+
+def make_form(amount):
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 72), "Amount due:")
+    widget = fitz.Widget()
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.field_name = "amount"
+    widget.field_value = amount
+    widget.rect = fitz.Rect(160, 60, 300, 80)
+    page.add_widget(widget)
+    try:
+        return document.tobytes()
+    finally:
+        document.close()
+
+def root_of(document_content):
+    document = fitz.open(stream=document_content, filetype="pdf")
+    try:
+        return compute_merkle_tree(document)[2]
+    finally:
+        document.close()
+
+def recomputed_root(document_content):
+    document = fitz.open(stream=document_content, filetype="pdf")
+    try:
+        manifest = json.loads(document.embfile_get(MERKLE_MANIFEST_NAME))
+        return compute_merkle_tree(document)[2].hex(), manifest["root"]
+    finally:
+        document.close()
+
+def test_signed_root_matches_saved_document():
+    signed, merkle_info = overlay_signature(make_document(), make_signature(), [
+        {"page_number": 2, "position_x": 50, "position_y": 50},
+        {"page_number": 3, "position_x": 100, "position_y": 300},
+    ])
+
+    root, manifest_root = recomputed_root(signed)
+    assert root == merkle_info["merkle_root"]
+    assert manifest_root == merkle_info["merkle_root"]
+
+def test_second_signature_covers_pages_edited_in_between():
+    signed, _ = overlay_signature(make_document(), make_signature(),
+                                  [{"page_number": 2, "position_x": 50, "position_y": 50}])
+    document = fitz.open(stream=signed, filetype="pdf")
+    document[2].insert_text((72, 300), "Edited after signing")
+    edited = document.tobytes()
+    document.close()
+
+    resigned, merkle_info = overlay_signature(edited, make_signature(),
+                                              [{"page_number": 2, "position_x": 50, "position_y": 300}])
+
+    assert recomputed_root(resigned)[0] == merkle_info["merkle_root"]
+
+def test_annotations_are_covered_by_the_root():
+    signed, merkle_info = overlay_signature(make_document(), make_signature(),
+                                            [{"page_number": 1, "position_x": 50, "position_y": 50}])
+    document = fitz.open(stream=signed, filetype="pdf")
+    document[1].add_freetext_annot(fitz.Rect(72, 400, 300, 450), "Added after signing")
+    annotated = document.tobytes()
+    document.close()
+
+    assert root_of(annotated).hex() != merkle_info["merkle_root"]
+
+def test_form_field_values_are_covered_by_the_root():
+    document = fitz.open(stream=make_form("100"), filetype="pdf")
+    page = document[0]
+    widget = next(page.widgets())
+    widget.field_value = "1000000"
+    widget.update()
+    changed = document.tobytes()
+    document.close()
+
+    assert root_of(changed) != root_of(make_form("100"))
+
+def test_single_page_verifies_against_the_signed_root(tmp_path):
+    signed, merkle_info = overlay_signature(make_document(), make_signature(),
+                                            [{"page_number": 2, "position_x": 50, "position_y": 50}])
+    signed_path = tmp_path / "signed.pdf"
+    signed_path.write_bytes(signed)
+    for page_number in (1, 2, 3):
+        assert verify_page_file(str(signed_path), page_number, merkle_info["merkle_root"])["valid"]
+
+    document = fitz.open(stream=signed, filetype="pdf")
+    document[1].insert_text((72, 500), "Edited after signing")
+    edited_path = tmp_path / "edited.pdf"
+    document.save(str(edited_path))
+    document.close()
+    assert not verify_page_file(str(edited_path), 2, merkle_info["merkle_root"])["valid"]
+    assert verify_page_file(str(edited_path), 1, merkle_info["merkle_root"])["valid"]